@@ -0,0 +1,387 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+import gmain
+
+BASE_PROCESSES = 400
+BASE_GAMES = 150
+BASE_WINDOWS = 50
+SCALE_PROCESSES = (100, 1000, 10000)
+SCALE_GAMES = (100, 1000, 10000, 100000)
+SCALE_WINDOWS = (10, 100, 1000)
+BROWSER_SHARE = 0.05
+MATCH_SHARE = 0.01
+
+
+class SyntheticProcessSource:
+    def __init__(self, names, churn=0, seed=0):
+        self.random = random.Random(seed)
+        self.churn = churn
+        self.table = dict(enumerate(names, start=1000))
+        self.next_pid = 1000 + len(names)
+
+    def pids(self):
+        return list(self.table)
+
+    def describe(self, pid):
+        name = self.table.get(pid)
+        if name is None:
+            return None
+        return name, 0.0
+
+    def started(self, pid):
+        return 0.0 if pid in self.table else None
+
+    def step(self):
+        if not self.churn:
+            return
+        for pid in self.random.sample(list(self.table), min(self.churn, len(self.table))):
+            self.table[self.next_pid] = self.table.pop(pid)
+            self.next_pid += 1
+
+
+def random_word(rnd, low=5, high=12):
+    return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(low, high)))
+
+
+def make_games(count, seed):
+    rnd = random.Random(seed)
+    return [random_word(rnd).capitalize() for _ in range(count)]
+
+
+def make_processes(count, games, seed):
+    rnd = random.Random(seed)
+    names = [gmain.music]
+    for i in range(count - 1):
+        roll = rnd.random()
+        if roll < BROWSER_SHARE:
+            names.append(rnd.choice(gmain.BROWSERS))
+        elif roll < BROWSER_SHARE + MATCH_SHARE and games:
+            names.append(f"{rnd.choice(games).lower()}-win64-shipping.exe")
+        else:
+            names.append(f"{random_word(rnd)}.exe")
+    return names
+
+
+def make_windows(count, source, seed):
+    rnd = random.Random(seed)
+    browsers = [pid for pid, name in source.table.items() if name in gmain.BROWSERS] or [0]
+    others = list(source.table) or [0]
+    windows = []
+    for hwnd in range(1, count + 1):
+        if rnd.random() < 0.3:
+            title = f"{random_word(rnd)} - YouTube - Google Chrome" if hwnd == count else f"{random_word(rnd)} - Google Chrome"
+            windows.append((hwnd, rnd.choice(browsers), title))
+        else:
+            windows.append((hwnd, rnd.choice(others), random_word(rnd, 8, 30)))
+    return windows
+
+
+def build_monitor(processes, games, windows, churn, seed):
+    game_list = make_games(games, seed)
+    source = SyntheticProcessSource(make_processes(processes, game_list, seed), churn, seed)
+    window_source = gmain.FakeWindowSource(make_windows(windows, source, seed))
+    monitor = gmain.ProcessMonitor(source, window_source, gmain.DetectionJournal(os.devnull))
+    started = time.perf_counter()
+    monitor.set_games(game_list)
+    setup = time.perf_counter() - started
+    return monitor, source, game_list, setup
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(step, ticks):
+    step()
+    samples = []
+    for _ in range(ticks):
+        started = time.perf_counter_ns()
+        step()
+        samples.append(time.perf_counter_ns() - started)
+
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    transient = 0
+    for _ in range(ticks):
+        # пик внутри тика над уровнем до него - память, которую тик занимает хотя бы на время
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step()
+        transient += tracemalloc.get_traced_memory()[1] - before
+    # сколько блоков осталось занятыми после всех тиков, а не сколько их было выделено
+    blocks = sys.getallocatedblocks() - blocks
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ticks': ticks,
+        'mean_us': sum(samples) / len(samples) / 1000,
+        'p50_us': percentile(samples, 0.50) / 1000,
+        'p90_us': percentile(samples, 0.90) / 1000,
+        'p99_us': percentile(samples, 0.99) / 1000,
+        'max_us': max(samples) / 1000,
+        'retained_blocks_per_tick': blocks / ticks,
+        'tick_peak_kb': transient / ticks / 1024,
+        'peak_kb': peak / 1024,
+    }
+
+
+def bench_monitor(processes, games, windows, ticks, churn, seed):
+    monitor, source, _, setup = build_monitor(processes, games, windows, churn, seed)
+
+    def step():
+        source.step()
+        snapshot = monitor.snapshot()
+        monitor.is_music_player_running(snapshot)
+        monitor.is_game_running(snapshot)
+        monitor.is_youtube_opened(snapshot)
+
+    return setup, measure(step, ticks)
+
+
+def bench_controller(processes, games, windows, ticks, churn, seed, core='sync'):
+    monitor, source, game_list, setup = build_monitor(processes, games, windows, churn, seed)
+    player = [pid for pid, name in source.table.items() if name == gmain.music]
+    controller = gmain.AppController(
+        monitor=monitor,
+        games=game_list,
+        audio_backend=gmain.FakeAudioBackend(player),
+        events=gmain.PollingEventSource().start(monitor.is_relevant),
+    )
+
+    if core == 'async':
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=gmain.PROBE_WORKERS, thread_name_prefix='probe',
+                                      initializer=controller.volume.backend.attach_thread)
+
+        def tick():
+            loop.run_until_complete(controller.tick_async(executor))
+    else:
+        tick = controller.tick
+
+    def step():
+        source.step()
+        controller.scheduler.wake(*controller.scheduler.probes)
+        tick()
+
+    try:
+        result = measure(step, ticks)
+    finally:
+        controller.ramp.close()
+        if core == 'async':
+            executor.shutdown()
+            loop.close()
+    return setup, result
+
+
+def bench_volume(sessions, ticks, cached, seed):
+    backend = gmain.FakeAudioBackend(range(1, sessions + 1))
+    volume = gmain.VolumeController(backend)
+    pids = [random.Random(seed).randint(1, sessions)]
+    levels = [gmain.SET_VOL, gmain.NORMAL_VOL]
+    counter = [0]
+
+    def step():
+        counter[0] += 1
+        if not cached:
+            volume.forget(pids)
+        volume.set_volume(levels[counter[0] % 2], pids)
+
+    result = measure(step, ticks)
+    result['enumerations'] = backend.enumerations
+    result['writes'] = backend.writes
+    return 0.0, result
+
+
+def bench_meter(sessions, ticks, seed):
+    rnd = random.Random(seed)
+    backend = gmain.FakeAudioBackend()
+    for pid in range(1, sessions + 1):
+        backend.set_level(pid, 0.0)
+    meter = gmain.ActivityMeter(backend)
+    exclude = frozenset([1])
+    clock = [0.0]
+
+    def step():
+        clock[0] += gmain.AUDIO_PROBE_CADENCE[0]
+        backend.set_level(rnd.randint(2, max(sessions, 2)), rnd.choice((0.0, 0.3)))
+        meter.sample(exclude, clock[0])
+
+    result = measure(step, ticks)
+    result['enumerations'] = backend.enumerations
+    result['reads'] = backend.reads
+    return 0.0, result
+
+
+def spawn(count):
+    if not count:
+        return []
+    if sys.platform == 'win32':
+        command = ['cmd', '/c', 'pause']
+    else:
+        command = ['sleep', '3600']
+    return [subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL) for _ in range(count)]
+
+
+def bench_source(kind, ticks, full):
+    source = gmain.create_process_source(kind)
+    tracker = gmain.ProcessTracker(source, lambda name: None)
+
+    def scan():
+        for pid in source.pids():
+            source.describe(pid)
+
+    started = time.perf_counter()
+    tracker.update()
+    setup = time.perf_counter() - started
+    result = measure(scan if full else tracker.update, ticks)
+    result['processes'] = len(tracker.table)
+    return setup, result
+
+
+def cases(args):
+    base = {'processes': BASE_PROCESSES, 'games': BASE_GAMES, 'windows': BASE_WINDOWS}
+    if args.grid:
+        for processes in args.processes:
+            for games in args.games:
+                for windows in args.windows:
+                    yield {'processes': processes, 'games': games, 'windows': windows}
+        return
+    for processes in args.processes:
+        yield dict(base, processes=processes)
+    for games in args.games:
+        yield dict(base, games=games)
+    for windows in args.windows:
+        yield dict(base, windows=windows)
+
+
+def run(args):
+    results = []
+    benches = args.bench
+    for params in cases(args):
+        if 'monitor' in benches:
+            setup, result = bench_monitor(ticks=args.ticks, churn=args.churn, seed=args.seed, **params)
+            results.append(report('monitor', dict(params, churn=args.churn), setup, result))
+        for name, core in (('controller', 'sync'), ('async', 'async')):
+            if name in benches:
+                setup, result = bench_controller(ticks=args.ticks, churn=args.churn, seed=args.seed, core=core, **params)
+                results.append(report(name, dict(params, churn=args.churn), setup, result))
+
+    if 'volume' in benches:
+        for sessions in (4, 32, 256):
+            for cached in (True, False):
+                setup, result = bench_volume(sessions, args.ticks, cached, args.seed)
+                results.append(report('volume', {'sessions': sessions, 'cached': cached}, setup, result))
+
+    if 'source' in benches:
+        kinds = ['psutil'] + (['procfs'] if os.path.isdir(gmain.PROC_ROOT) else [])
+        children = spawn(args.spawn)
+        try:
+            for kind in kinds:
+                for full in (True, False):
+                    setup, result = bench_source(kind, args.ticks, full)
+                    params = {'source': kind, 'mode': 'full' if full else 'tracker', 'spawned': args.spawn}
+                    results.append(report('source', params, setup, result))
+        finally:
+            for child in children:
+                child.kill()
+            for child in children:
+                child.wait()
+
+    if 'meter' in benches:
+        for sessions in (4, 32, 256):
+            setup, result = bench_meter(sessions, args.ticks, args.seed)
+            results.append(report('meter', {'sessions': sessions}, setup, result))
+
+    return results
+
+
+def report(name, params, setup, result):
+    entry = dict(result, bench=name, params=params, setup_ms=setup * 1000)
+    label = ' '.join(f"{key}={value}" for key, value in params.items())
+    print(f"{name:<10} {label:<55} p50={entry['p50_us']:>9.1f}мкс p99={entry['p99_us']:>9.1f}мкс "
+          f"остаток блоков/тик={entry['retained_blocks_per_tick']:>7.1f} "
+          f"пик тика={entry['tick_peak_kb']:>7.1f}КБ пик={entry['peak_kb']:>8.1f}КБ подготовка={entry['setup_ms']:.1f}мс", flush=True)
+    return entry
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, path, threshold):
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = {(entry['bench'], json.dumps(entry['params'], sort_keys=True)): entry
+                    for entry in json.load(f)['results']}
+
+    print(f"\nСравнение с {path}:")
+    for entry in results:
+        old = baseline.get((entry['bench'], json.dumps(entry['params'], sort_keys=True)))
+        if not old or not old['p50_us']:
+            continue
+        ratio = entry['p50_us'] / old['p50_us']
+        label = ' '.join(f"{key}={value}" for key, value in entry['params'].items())
+        marker = '  <-- регрессия' if ratio > 1 + threshold else ''
+        print(f"{entry['bench']:<10} {label:<55} p50 x{ratio:.2f}{marker}")
+
+
+def parse_sizes(value):
+    return tuple(int(part) for part in value.split(',') if part)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные замеры цикла мониторинга gmain.py")
+    parser.add_argument('--bench', default='monitor,controller,async,volume,meter',
+                        type=lambda value: set(value.split(',')), help="monitor,controller,async,volume,meter,source")
+    parser.add_argument('--processes', type=parse_sizes, default=SCALE_PROCESSES)
+    parser.add_argument('--games', type=parse_sizes, default=SCALE_GAMES)
+    parser.add_argument('--windows', type=parse_sizes, default=SCALE_WINDOWS)
+    parser.add_argument('--grid', action='store_true', help="декартово произведение всех размеров")
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--churn', type=int, default=0, help="процессов, заменяемых на каждом тике")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--spawn', type=int, default=0, help="фоновых процессов для замера source")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="JSON предыдущего прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.25, help="допустимый рост p50 при сравнении")
+    args = parser.parse_args()
+
+    logger.remove()
+    results = run(args)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': current_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
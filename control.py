@@ -0,0 +1,78 @@
+import getpass
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+if sys.platform == 'win32':
+    FAMILY = 'AF_PIPE'
+    ADDRESS = rf'\\.\pipe\control_music-{getpass.getuser()}'
+else:
+    FAMILY = 'AF_UNIX'
+    ADDRESS = os.path.join(tempfile.gettempdir(), f'control_music-{os.getuid()}.sock')
+    LOCK_FILE = os.path.join(tempfile.gettempdir(), f'control_music-{os.getuid()}.lock')
+
+START_TIMEOUT = 5.0
+
+
+def send(conn, message):
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def receive(conn):
+    return json.loads(conn.recv_bytes().decode('utf-8'))
+
+
+class ControlClient:
+    def __init__(self, address=ADDRESS):
+        self.conn = Client(address, FAMILY)
+        self.lock = threading.Lock()
+
+    def request(self, command, **args):
+        with self.lock:
+            send(self.conn, dict(args, cmd=command))
+            return receive(self.conn)
+
+    def subscribe(self, on_lines):
+        send(self.conn, {'cmd': 'subscribe-logs'})
+        reply = receive(self.conn)
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error'))
+        try:
+            while True:
+                on_lines(receive(self.conn)['log'])
+        except (EOFError, OSError):
+            pass
+
+    def close(self):
+        self.conn.close()
+
+
+def connect(address=ADDRESS):
+    try:
+        return ControlClient(address)
+    except (OSError, EOFError):
+        return None
+
+
+def wait_for_daemon(timeout=START_TIMEOUT, address=ADDRESS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = connect(address)
+        if client is not None:
+            return client
+        time.sleep(0.05)
+    return None
+
+
+def listen(address=ADDRESS):
+    # вызывается только под блокировкой экземпляра, иначе можно удалить сокет работающего демона
+    if FAMILY == 'AF_UNIX' and os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, FAMILY)
+    if FAMILY == 'AF_UNIX':
+        os.chmod(address, 0o600)
+    return listener
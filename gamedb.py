@@ -0,0 +1,303 @@
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from settings import write_temp
+
+MAGIC = b'GMDB'
+VERSION = 1
+HEADER = struct.Struct('<4sIqQ20s7I')
+
+
+def as_sources(source):
+    return (source,) if isinstance(source, (str, bytes, os.PathLike)) else tuple(source)
+
+
+def file_digest(source):
+    digest = hashlib.sha1()
+    for path in as_sources(source):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        # граница между файлами, иначе перенос строки из одного в другой не меняет хэш
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def source_stamp(source):
+    size = mtime = 0
+    for path in as_sources(source):
+        stat = os.stat(path)
+        size += stat.st_size
+        mtime = max(mtime, stat.st_mtime_ns)
+    return size, mtime
+
+
+def parse_games(lines):
+    titles = []
+    patterns = []
+    exact = []
+    excluded = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('!'):
+            excluded.append(line[1:].strip().lower())
+            continue
+
+        title, _, aliases = line.partition('=')
+        title = title.strip()
+        aliases = [alias.strip().lower() for alias in aliases.split(',') if alias.strip()]
+        index = len(titles)
+        titles.append(title)
+        if aliases:
+            exact.extend((alias, index) for alias in aliases)
+        else:
+            patterns.append((title.lower(), index))
+    return titles, patterns, exact, excluded
+
+
+def build_automaton(patterns):
+    goto = [{}]
+    fail = [0]
+    out = [set()]
+    for pattern, index in patterns:
+        state = 0
+        for ch in pattern:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto.append({})
+                fail.append(0)
+                out.append(set())
+                goto[state][ch] = nxt
+            state = nxt
+        out[state].add(index)
+
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0)
+            if fail[nxt] == nxt:
+                fail[nxt] = 0
+            out[nxt] |= out[fail[nxt]]
+    return goto, fail, out
+
+
+def read_lines(source):
+    for path in as_sources(source):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+
+
+def compile_games(source, target):
+    titles, patterns, exact, excluded = parse_games(read_lines(source))
+
+    blob = bytearray()
+
+    def offsets(strings):
+        result = array('I', [len(blob)])
+        for string in strings:
+            blob.extend(string.encode('utf-8'))
+            result.append(len(blob))
+        return result
+
+    exact.sort(key=lambda entry: entry[0].encode('utf-8'))
+    excluded = sorted(set(excluded), key=lambda name: name.encode('utf-8'))
+    title_offsets = offsets(titles)
+    exact_offsets = offsets(name for name, _ in exact)
+    exact_titles = array('I', (index for _, index in exact))
+    excluded_offsets = offsets(excluded)
+
+    seen = set()
+    unique = []
+    for pattern, index in patterns:
+        if pattern not in seen:
+            seen.add(pattern)
+            unique.append((pattern, index))
+    goto, fail, out = build_automaton(unique)
+
+    edge_start = array('I', [0])
+    edge_char = array('I')
+    edge_next = array('I')
+    out_start = array('I', [0])
+    outputs = array('I')
+    for state in range(len(goto)):
+        for ch, nxt in sorted(goto[state].items()):
+            edge_char.append(ord(ch))
+            edge_next.append(nxt)
+        edge_start.append(len(edge_char))
+        outputs.extend(sorted(out[state]))
+        out_start.append(len(outputs))
+
+    size, mtime = source_stamp(source)
+    header = HEADER.pack(MAGIC, VERSION, size, mtime, file_digest(source),
+                         len(titles), len(exact), len(excluded), len(goto), len(edge_char), len(outputs), len(blob))
+
+    def write(f):
+        f.write(header)
+        for table in (title_offsets, exact_offsets, exact_titles, excluded_offsets,
+                      edge_start, edge_char, edge_next, array('I', fail), out_start, outputs):
+            table.tofile(f)
+        f.write(blob)
+
+    # переименовывает install(), когда монитор готов отпустить старую базу
+    return write_temp(target, write, '.games-', '.db', binary=True)
+
+
+def read_header(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    header = HEADER.unpack(data)
+    if header[0] != MAGIC or header[1] != VERSION:
+        return None
+    return header
+
+
+def is_fresh(source, target):
+    header = read_header(target)
+    if header is None:
+        return False
+    size, mtime = source_stamp(source)
+    if (header[2], header[3]) == (size, mtime):
+        return True
+    if header[4] != file_digest(source):
+        return False
+
+    # содержимое не изменилось, достаточно обновить отметку времени в заголовке
+    with open(target, 'r+b') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, mtime, *header[4:]))
+    return True
+
+
+def prepare(source, target):
+    if is_fresh(source, target):
+        return None
+    return compile_games(source, target)
+
+
+def install(built, target, current=None):
+    try:
+        os.replace(built, target)
+    except PermissionError:
+        # Windows не даёт заменить отображённый в память файл
+        if current is None or not hasattr(current, 'close'):
+            raise
+        current.close()
+        os.replace(built, target)
+
+
+class GameDatabase:
+    def __init__(self, path, blacklist=()):
+        self.path = path
+        self.blacklist = frozenset(name.lower() for name in blacklist)
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._map)
+        if header[0] != MAGIC or header[1] != VERSION:
+            self.close()
+            raise ValueError(f"{path}: неизвестный формат базы игр")
+
+        self.source_size, self.source_mtime, self.source_digest = header[2:5]
+        titles, exact, excluded, states, edges, outputs, blob_size = header[5:]
+        self._titles = titles
+
+        tables = memoryview(self._map)[HEADER.size:].cast('B')
+        sizes = (titles + 1, exact + 1, exact, excluded + 1, states + 1, edges, edges, states, states + 1, outputs)
+        views = []
+        offset = 0
+        for size in sizes:
+            views.append(tables[offset:offset + size * 4].cast('I'))
+            offset += size * 4
+        (self._title_offsets, self._exact_offsets, self._exact_titles, self._excluded_offsets,
+         self._edge_start, self._edge_char, self._edge_next, self._fail, self._out_start, self._out) = views
+        self._blob = tables[offset:offset + blob_size]
+        self._views = views + [self._blob, tables]
+
+    def __len__(self):
+        return self._titles
+
+    def title(self, index):
+        return str(self._blob[self._title_offsets[index]:self._title_offsets[index + 1]], 'utf-8')
+
+    def _find(self, offsets, count, key):
+        lo, hi = 0, count
+        blob = self._blob
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _contains(self, offsets, count, key):
+        i = self._find(offsets, count, key)
+        return i < count and self._blob[offsets[i]:offsets[i + 1]].tobytes() == key
+
+    def match(self, process_name):
+        if process_name in self.blacklist or not self._views:
+            return ()
+
+        key = process_name.encode('utf-8')
+        if self._contains(self._excluded_offsets, len(self._excluded_offsets) - 1, key):
+            return ()
+
+        found = set()
+        offsets = self._exact_offsets
+        count = len(offsets) - 1
+        i = self._find(offsets, count, key)
+        while i < count and self._blob[offsets[i]:offsets[i + 1]].tobytes() == key:
+            found.add(self._exact_titles[i])
+            i += 1
+
+        edge_start, edge_char, edge_next = self._edge_start, self._edge_char, self._edge_next
+        fail, out_start = self._fail, self._out_start
+        state = 0
+        for ch in process_name:
+            code = ord(ch)
+            while True:
+                lo, hi = edge_start[state], edge_start[state + 1]
+                j = bisect_left(edge_char, code, lo, hi)
+                if j < hi and edge_char[j] == code:
+                    state = edge_next[j]
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if out_start[state] != out_start[state + 1]:
+                found.update(self._out[out_start[state]:out_start[state + 1]])
+
+        if not found:
+            return ()
+        # одна игра может попасть и по слову из games.txt, и по имени файла из манифеста
+        return tuple(dict.fromkeys(self.title(i) for i in sorted(found)))
+
+    def close(self):
+        for view in getattr(self, '_views', ()):
+            view.release()
+        self._views = ()
+        self._map.close()
+        self._file.close()
+
+
+def open_games(source, target, blacklist=()):
+    built = prepare(source, target)
+    if built is not None:
+        install(built, target)
+    return GameDatabase(target, blacklist)
@@ -1,42 +1,1170 @@
 import psutil
 import time
-import win32gui
-import win32process
-from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
 from loguru import logger
-import configparser
+import atexit
+import bisect
+import asyncio
+import functools
+import gzip
+import http.server
+import json
+import math
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
-config = configparser.ConfigParser()
-config.read('config.ini', encoding='utf-8')
+try:
+    from pycaw.pycaw import AudioUtilities, IAudioMeterInformation, ISimpleAudioVolume
+except ImportError:
+    AudioUtilities = IAudioMeterInformation = ISimpleAudioVolume = None
 
-SETTINGS = config['SETTINGS']
+import control
+import gamedb
+import launchers
+import rules
+from settings import FileWatch, Settings
+from windows import EventWindowSource, FakeWindowSource, ThreadedSource, create_window_source
+
+config = Settings.shared()
+
+SETTINGS = config.section
 
 SET_VOL = float(SETTINGS.get('set_vol', '0'))
 NORMAL_VOL = float(SETTINGS.get('normal_vol', '100'))
 CHECK_INTERVAL = 0.5
+CLASSIFY_CACHE_SIZE = 4096
+BROWSERS = ('chrome.exe', 'msedge.exe', 'firefox.exe')
 GAMES_FILE = 'games.txt'
+GAMES_DB = 'games.db'
+LAUNCHERS_FILE = launchers.LAUNCHERS_FILE
+LAUNCHERS_CACHE = launchers.CACHE_FILE
+LAUNCHER_SCAN = SETTINGS.get('launcher_scan', 'yes').lower() in ('yes', 'true', '1', 'on')
+LAUNCHER_SCAN_INTERVAL = float(SETTINGS.get('launcher_scan_interval', '300'))
+RULES_FILE = SETTINGS.get('rules_file', rules.RULES_FILE)
+JOURNAL_FILE = 'detections.log'
+JOURNAL_MAX_BYTES = 1024 * 1024
+JOURNAL_BACKUPS = 3
+JOURNAL_FLUSH_INTERVAL = 5.0
+JOURNAL_BATCH = 64
+JOURNAL_SEEN_LIMIT = 10000
 music = SETTINGS.get('player_version', 'Свой вариант')
 
 LANGUAGE = SETTINGS.get('language', 'ru')
 WINDOW_X = int(SETTINGS.get('window_x', '1326'))
 WINDOW_Y = int(SETTINGS.get('window_y', '436'))
+EVENT_SOURCE = SETTINGS.get('event_source', 'auto')
+WINDOW_SOURCE = SETTINGS.get('window_source', 'auto')
+PROCESS_SOURCE = SETTINGS.get('process_source', 'auto')
+PROC_ROOT = '/proc'
+PROC_BUFFER_SIZE = 4096
+PROC_COMM_LEN = 15
+PF_KTHREAD = 0x00200000
+AUDIO_BACKEND = SETTINGS.get('audio_backend', 'auto')
+RAMP_DURATION = float(SETTINGS.get('ramp_duration', '0.6'))
+RAMP_CURVE = SETTINGS.get('ramp_curve', 'equal-power')
+RAMP_STEPS = 20
+METRICS_PORT = int(SETTINGS.get('metrics_port', '9477'))
+METRIC_PREFIX = 'control_music'
+METRIC_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                  0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOG_BACKLOG_LINES = 500
+ERROR_ALREADY_EXISTS = 183
+CPU_BUDGET = float(SETTINGS.get('cpu_budget', '2')) / 100
+TRACE_FILE = SETTINGS.get('trace_file', '')
+TRACE_FLUSH_TICKS = 100
+ACTIVITY_DUCKING = SETTINGS.get('activity_ducking', 'no').lower() in ('yes', 'true', '1', 'on')
+ACTIVITY_ATTACK = float(SETTINGS.get('activity_attack', '0.05'))
+ACTIVITY_RELEASE = float(SETTINGS.get('activity_release', '0.8'))
+ACTIVITY_ON = float(SETTINGS.get('activity_on', '0.02'))
+ACTIVITY_OFF = float(SETTINGS.get('activity_off', '0.01'))
+
+# name: (min interval, max interval, result ttl), seconds
+PROBE_CADENCE = {
+    'player': (CHECK_INTERVAL, 4.0, 10.0),
+    'game': (CHECK_INTERVAL, 4.0, 10.0),
+    'window': (CHECK_INTERVAL, 2.0, 5.0),
+}
+AUDIO_PROBE_CADENCE = (0.2, 1.0, 2.0)
+PROBE_BACKOFF = 1.5
+CPU_BUDGET_WINDOW = 10.0
+MAX_THROTTLE = 8.0
+MIN_TICK_SLEEP = 0.05
+SCHEDULER_DECISIONS = 20
+CORE = SETTINGS.get('core', 'async')
+PROBE_WORKERS = 3
+PROBE_TIMEOUT = float(SETTINGS.get('probe_timeout', '2'))
+TICK_DEADLINE = float(SETTINGS.get('tick_deadline', '0.25'))
+LOG_FILE = 'app.log'
+PROFILE_SECONDS = float(SETTINGS.get('profile_seconds', '10'))
+PROFILE_INTERVAL = 0.01
+PROFILE_TOP = 15
+# верхние кадры потоков, которые ждут событий, а не работают
+PROFILE_IDLE_FRAMES = frozenset((
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('thread.py', '_worker'),
+    ('queue.py', 'get'),
+))
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds=METRIC_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, value, probe=None):
+        key = (name, probe)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def render(self):
+        lines = []
+        typed = set()
+        for (name, probe), histogram in sorted(dict(self.histograms).items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            labels = f'probe="{probe}",' if probe else ''
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ''
+            lines.append(f"{metric}_sum{suffix} {histogram.total:.9f}")
+            lines.append(f"{metric}_count{suffix} {histogram.count}")
+        for name, value in sorted(dict(self.counters).items()):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            lines.append(f"{self.prefix}_{name} {value}")
+        for name, value in sorted(dict(self.gauges).items()):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        lines = []
+        for (name, probe), histogram in sorted(dict(self.histograms).items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            average = histogram.total / histogram.count if histogram.count else 0.0
+            lines.append(f"{(probe or name):<18} n={histogram.count:<8} ср={average * 1000:8.3f}мс "
+                         f"p50≤{histogram.quantile(0.5) * 1000:g}мс p99≤{histogram.quantile(0.99) * 1000:g}мс")
+        for name, value in sorted(dict(self.counters).items()):
+            lines.append(f"{name:<18} {value}")
+        for name, value in sorted(dict(self.gauges).items()):
+            lines.append(f"{name:<18} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = metrics.render()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/summary':
+            body = metrics.summary()
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT):
+    if not port:
+        return None
+    try:
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Метрики недоступны на порту {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Метрики: http://127.0.0.1:{port}/metrics")
+    return server
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, top=PROFILE_TOP):
+        self.interval = interval
+        self.top = top
+        self.lock = threading.Lock()
+        self.thread = None
+        self.labels = {}
+        self.idle_codes = {}
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, path, threads):
+        with self.lock:
+            if self.running:
+                raise RuntimeError("профилирование уже идёт")
+            self.thread = threading.Thread(target=self._run, args=(seconds, path, threads),
+                                           name="profiler", daemon=True)
+            self.thread.start()
+        logger.info(f"Профилирование на {seconds:g} с, интервал {self.interval * 1000:g} мс")
+        return path
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def is_idle(self, code):
+        idle = self.idle_codes.get(code)
+        if idle is None:
+            idle = self.idle_codes[code] = (os.path.basename(code.co_filename), code.co_name) in PROFILE_IDLE_FRAMES
+        return idle
+
+    def _run(self, seconds, path, threads):
+        stacks = {}
+        samples = idle = 0
+        spent = 0.0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            mark = time.perf_counter()
+            names = threads()
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident)
+                if name is None:
+                    continue
+                if self.is_idle(frame.f_code):
+                    idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name)
+                key = ';'.join(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            samples += 1
+            spent += time.perf_counter() - mark
+            time.sleep(self.interval)
+
+        elapsed = time.perf_counter() - started
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                for key, count in sorted(stacks.items()):
+                    f.write(f"{key} {count}\n")
+        except OSError as e:
+            logger.error(f"Не удалось записать профиль {path}: {e}")
+            return
+
+        busy = sum(stacks.values())
+        logger.info(f"Профиль записан в {path}: {samples} выборок за {elapsed:.1f} с, "
+                    f"стеков в работе {busy}, в ожидании {idle}, накладные расходы {spent / elapsed * 100:.2f}%")
+        for line in self.summary(stacks):
+            logger.info(line)
+
+    def summary(self, stacks):
+        total = sum(stacks.values())
+        if not total:
+            return ["Профиль пуст: отслеживаемые потоки всё время ждали"]
+        own = {}
+        inclusive = {}
+        for key, count in stacks.items():
+            frames = key.split(';')[1:]
+            if frames:
+                own[frames[-1]] = own.get(frames[-1], 0) + count
+            for frame in set(frames):
+                inclusive[frame] = inclusive.get(frame, 0) + count
+
+        lines = [f"Топ-{self.top} функций (собственное / с вызванными, % от {total} стеков):"]
+        for frame, count in sorted(own.items(), key=lambda item: -item[1])[:self.top]:
+            lines.append(f"  {count / total * 100:5.1f}% {inclusive[frame] / total * 100:5.1f}%  {frame}")
+        return lines
+
+
+class PycawAudioBackend:
+    name = 'pycaw'
+
+    def attach_thread(self):
+        import comtypes
+        comtypes.CoInitialize()
+
+    def sessions(self):
+        handles = {}
+        for session in AudioUtilities.GetAllSessions():
+            if session.ProcessId:
+                handles[session.ProcessId] = session._ctl.QueryInterface(ISimpleAudioVolume)
+        return handles
+
+    def set_volume(self, handle, volume):
+        handle.SetMasterVolume(volume / 100, None)
+
+    def meters(self):
+        meters = {}
+        for session in AudioUtilities.GetAllSessions():
+            if session.ProcessId:
+                meters[session.ProcessId] = session._ctl.QueryInterface(IAudioMeterInformation)
+        return meters
+
+    def peak(self, meter):
+        return meter.GetPeakValue()
+
+
+class FakeAudioBackend:
+    name = 'fake'
+
+    def __init__(self, pids=()):
+        self.volumes = {pid: 100.0 for pid in pids}
+        self.levels = {}
+        self.enumerations = 0
+        self.writes = 0
+        self.reads = 0
+
+    def attach_thread(self):
+        pass
+
+    def sessions(self):
+        self.enumerations += 1
+        return {pid: pid for pid in self.volumes}
+
+    def set_volume(self, handle, volume):
+        if handle not in self.volumes:
+            raise OSError(f"Аудиосессия {handle} закрыта")
+        self.writes += 1
+        self.volumes[handle] = volume
+
+    def set_level(self, pid, peak):
+        if peak is None:
+            self.levels.pop(pid, None)
+        else:
+            self.levels[pid] = peak
+
+    def meters(self):
+        self.enumerations += 1
+        return {pid: pid for pid in self.levels}
+
+    def peak(self, meter):
+        if meter not in self.levels:
+            raise OSError(f"Аудиосессия {meter} закрыта")
+        self.reads += 1
+        return self.levels[meter]
+
+
+def create_audio_backend(kind=AUDIO_BACKEND):
+    if kind == 'fake':
+        return FakeAudioBackend()
+    if AudioUtilities is None:
+        if kind == 'pycaw':
+            raise RuntimeError("pycaw не установлен")
+        logger.warning("pycaw недоступен, громкость не будет изменяться")
+        return FakeAudioBackend()
+    return PycawAudioBackend()
+
+
+class ActivityMeter:
+    def __init__(self, backend, attack=ACTIVITY_ATTACK, release=ACTIVITY_RELEASE,
+                 on_level=ACTIVITY_ON, off_level=ACTIVITY_OFF):
+        self.backend = backend
+        self.attack = attack
+        self.release = release
+        self.on_level = on_level
+        self.off_level = off_level
+        self.meters = None
+        self.envelope = 0.0
+        self.active = False
+        self._sampled = None
+
+    def refresh(self):
+        self.meters = None
+
+    def peak(self, exclude):
+        if self.meters is None:
+            self.meters = self.backend.meters()
+
+        peak = 0.0
+        for pid, meter in self.meters.items():
+            if pid in exclude:
+                continue
+            try:
+                level = self.backend.peak(meter)
+            except Exception:
+                self.meters = None
+                continue
+            if level > peak:
+                peak = level
+        return peak
+
+    def sample(self, exclude, now):
+        peak = self.peak(exclude)
+        if self._sampled is None:
+            self.envelope = peak
+        else:
+            tau = self.attack if peak > self.envelope else self.release
+            weight = 1.0 - math.exp(-(now - self._sampled) / tau) if tau > 0 else 1.0
+            self.envelope += (peak - self.envelope) * weight
+        self._sampled = now
+
+        if self.active and self.envelope < self.off_level:
+            self.active = False
+        elif not self.active and self.envelope >= self.on_level:
+            self.active = True
+        return self.active
+
+
+VolumeTarget = namedtuple('VolumeTarget', 'name volume pids')
+PlayerProfile = namedtuple('PlayerProfile', 'name set_vol normal_vol')
+
 
 class VolumeController:
-    @staticmethod
-    def set_volume(volume):
-        sessions = AudioUtilities.GetAllSessions()
-        for session in sessions:
-            if session.Process and session.Process.name().lower() == music.lower():
-                volume_control = session._ctl.QueryInterface(ISimpleAudioVolume)
-                volume_control.SetMasterVolume(volume / 100, None)
-                logger.debug(f"Установлена громкость {volume}% для {music}")
-                return True
-        logger.warning(f"Процесс {music} не найден")
-        return False
+    def __init__(self, backend, name=music):
+        self.backend = backend
+        self.name = name
+        self.handles = {}
+        self.applied = {}
+        self._lock = threading.RLock()
+
+    def current(self, pids):
+        with self._lock:
+            for pid in pids:
+                if pid in self.applied:
+                    return self.applied[pid]
+        return None
+
+    def _resolve(self, targets):
+        missing = [target for target in targets if not any(pid in self.handles for pid in target.pids)]
+        if missing:
+            sessions = self.backend.sessions()
+            for target in missing:
+                for pid in target.pids:
+                    if pid in sessions:
+                        self.handles[pid] = sessions[pid]
+
+    def set_volume(self, volume, pids):
+        return self.apply([VolumeTarget(self.name, volume, tuple(pids))])[self.name]
+
+    def apply(self, targets, retry=True):
+        started = time.perf_counter()
+        with self._lock:
+            results = self._apply(targets, retry)
+        metrics.observe('probe_seconds', time.perf_counter() - started, 'volume_apply')
+        return results
+
+    def _apply(self, targets, retry):
+        self._resolve(targets)
+        results = {}
+        stale = []
+
+        for target in targets:
+            handles = [(pid, self.handles[pid]) for pid in target.pids if pid in self.handles]
+            if not handles:
+                logger.warning(f"Процесс {target.name} не найден")
+                results[target.name] = False
+                continue
+
+            results[target.name] = True
+            for pid, handle in handles:
+                if self.applied.get(pid) == target.volume:
+                    continue
+                try:
+                    self.backend.set_volume(handle, target.volume)
+                except Exception as e:
+                    logger.debug(f"Сессия PID {pid} недействительна: {e}")
+                    self.forget([pid])
+                    stale.append(target)
+                    results[target.name] = False
+                    break
+                self.applied[pid] = target.volume
+                logger.debug(f"Установлена громкость {target.volume}% для {target.name}")
+
+        if stale and retry:
+            results.update(self._apply(stale, retry=False))
+        return results
+
+    def forget(self, pids):
+        with self._lock:
+            for pid in pids:
+                self.handles.pop(pid, None)
+                self.applied.pop(pid, None)
+
+
+RAMP_CURVES = {
+    'linear': lambda t: t,
+    'exponential': lambda t: math.expm1(4 * t) / math.expm1(4),
+    'equal-power': lambda t: math.sin(t * math.pi / 2),
+}
+
+
+def ramp_table(curve, steps):
+    shape = RAMP_CURVES[curve]
+    return tuple(shape(i / steps) for i in range(1, steps + 1))
+
+
+class RampWorker:
+    def __init__(self, volume, duration=RAMP_DURATION, curve=RAMP_CURVE, steps=RAMP_STEPS, on_applied=None):
+        self.volume = volume
+        self.table = ramp_table(curve, steps)
+        self.step_delay = duration / steps
+        self.on_applied = on_applied
+        self.applied_id = 0
+        self._next_id = 0
+        self._pending = None
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="volume-ramp", daemon=True)
+        self._thread.start()
+
+    def submit(self, targets):
+        with self._cond:
+            self._next_id += 1
+            if self._pending is not None:
+                logger.debug(f"Команда #{self._pending[0]} вытеснена командой #{self._next_id}")
+            self._pending = (self._next_id, tuple(targets), time.perf_counter())
+            self._cond.notify_all()
+            return self._next_id
+
+    def wait_applied(self, command_id, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.applied_id >= command_id, timeout)
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _take(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending is not None or self._stopped)
+            command, self._pending = self._pending, None
+            return command
+
+    def _superseded(self):
+        with self._cond:
+            return self._pending is not None or self._stopped
+
+    def _run(self):
+        self.volume.backend.attach_thread()
+        while True:
+            command = self._take()
+            if command is None:
+                return
+            try:
+                self._ramp(*command)
+            except Exception as e:
+                logger.error(f"Ошибка плавного изменения громкости: {e}")
+
+    def _ramp(self, command_id, targets, submitted):
+        starts = {}
+        for target in targets:
+            start = self.volume.current(target.pids)
+            if start is not None:
+                starts[target.name] = start
+        table = self.table if starts else (1.0,)
+
+        for i, fraction in enumerate(table):
+            if i and self._superseded():
+                return
+            if not targets:
+                break
+            step = []
+            for target in targets:
+                start = starts.get(target.name, target.volume)
+                step.append(target._replace(volume=round(start + (target.volume - start) * fraction, 1)))
+            results = self.volume.apply(step)
+            targets = [target for target in targets if results.get(target.name)]
+            if targets and fraction < 1.0:
+                time.sleep(self.step_delay)
+
+        # команда без применённых целей тоже завершена, иначе wait_applied ждёт до таймаута
+        with self._cond:
+            self.applied_id = command_id
+            self._cond.notify_all()
+        if targets:
+            logger.debug(f"Громкость применена (команда #{command_id}): "
+                         + ", ".join(f"{target.name}={target.volume}%" for target in targets))
+        else:
+            logger.debug(f"Команда #{command_id}: нет сессий для изменения громкости")
+        if self.on_applied:
+            self.on_applied(command_id, targets, time.perf_counter() - submitted)
+
+
+Classification = namedtuple('Classification', 'games browser')
+TrackedProcess = namedtuple('TrackedProcess', 'name create_time classification')
+ProcessDelta = namedtuple('ProcessDelta', 'started exited')
+
+
+class PsutilProcessSource:
+    name = 'psutil'
+
+    def pids(self):
+        return psutil.pids()
+
+    def describe(self, pid):
+        try:
+            info = psutil.Process(pid).as_dict(['name', 'create_time'])
+        except (psutil.NoSuchProcess, psutil.ZombieProcess):
+            return None
+        return info['name'], info['create_time']
+
+    def started(self, pid):
+        try:
+            return psutil.Process(pid).create_time()
+        except (psutil.NoSuchProcess, psutil.ZombieProcess):
+            return None
+
+
+class ProcfsProcessSource:
+    name = 'procfs'
+
+    def __init__(self, root=PROC_ROOT):
+        self.root = root
+        self.root_bytes = os.fsencode(root)
+        # describe() зовут и поток событий, и пробы: у каждого потока свой буфер для readv
+        self.local = threading.local()
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.boot_time = self._boot_time()
+        self.kernel = set()
+
+    def _boot_time(self):
+        with open(os.path.join(self.root, 'stat'), 'rb') as f:
+            for line in f:
+                if line.startswith(b'btime'):
+                    return float(line.split()[1])
+        return psutil.boot_time()
+
+    @property
+    def buffer(self):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = bytearray(PROC_BUFFER_SIZE)
+        return buffer
+
+    def _read(self, path, buffer):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return os.readv(fd, [buffer])
+        finally:
+            os.close(fd)
+
+    def pids(self):
+        pids = {int(entry) for entry in os.listdir(self.root_bytes) if entry.isdigit()}
+        if self.kernel:
+            self.kernel &= pids
+            pids -= self.kernel
+        return pids
+
+    def _stat(self, pid, buffer):
+        try:
+            size = self._read(f'{self.root}/{pid}/stat', buffer)
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            # при hidepid чужие процессы недоступны, они для монитора просто не существуют
+            return None, -1, -1
+        start = buffer.find(b'(', 0, size)
+        end = buffer.rfind(b')', 0, size)
+        if start < 0 or end < 0:
+            return None, -1, -1
+        return buffer[end + 2:size].split(), start, end
+
+    def started(self, pid):
+        fields = self._stat(pid, self.buffer)[0]
+        if fields is None:
+            return None
+        return self.boot_time + int(fields[19]) / self.clock_ticks
+
+    def describe(self, pid):
+        buffer = self.buffer
+        fields, start, end = self._stat(pid, buffer)
+        if fields is None:
+            return None
+        if fields[0] == b'Z':
+            return None
+        if int(fields[6]) & PF_KTHREAD:
+            self.kernel.add(pid)
+            return None
+
+        name = buffer[start + 1:end].decode('utf-8', 'replace')
+        if len(name) >= PROC_COMM_LEN:
+            name = self._full_name(pid, name, buffer)
+        return name, self.boot_time + int(fields[19]) / self.clock_ticks
+
+    def _full_name(self, pid, name, buffer):
+        # comm обрезается ядром до 15 символов, полное имя берём из argv[0]
+        try:
+            size = self._read(f'{self.root}/{pid}/cmdline', buffer)
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return name
+        end = buffer.find(b'\0', 0, size)
+        argv0 = os.path.basename(bytes(buffer[:size if end < 0 else end])).decode('utf-8', 'replace')
+        return argv0 if argv0.startswith(name) else name
+
+
+def create_process_source(kind=PROCESS_SOURCE):
+    if kind == 'psutil':
+        return PsutilProcessSource()
+    if kind == 'procfs' or (kind == 'auto' and sys.platform.startswith('linux') and os.path.isdir(PROC_ROOT)):
+        return ProcfsProcessSource()
+    return PsutilProcessSource()
+
+
+class ProcessSnapshot:
+    __slots__ = ('pids', 'names', 'by_name')
+
+    def __init__(self, entries):
+        pids = []
+        names = []
+        by_name = {}
+        for pid, name in entries:
+            name = (name or '').lower()
+            pids.append(pid)
+            names.append(name)
+            by_name.setdefault(name, []).append(pid)
+        self.pids = tuple(pids)
+        self.names = tuple(names)
+        self.by_name = MappingProxyType({name: tuple(p) for name, p in by_name.items()})
+
+    def __len__(self):
+        return len(self.pids)
+
+    def has_name(self, name):
+        return name.lower() in self.by_name
+
+    def pids_for(self, names):
+        result = []
+        for name in names:
+            result.extend(self.by_name.get(name, ()))
+        return result
+
+
+class GameMatcher:
+    # тот же разбор и автомат, что у games.db, но в памяти: для списков из replay.py и bench.py
+    def __init__(self, games, blacklist=()):
+        self.blacklist = frozenset(name.lower() for name in blacklist)
+        self.titles, patterns, exact, excluded = gamedb.parse_games(games)
+        self.excluded = frozenset(excluded)
+        self.exact = {}
+        for alias, index in exact:
+            self.exact.setdefault(alias, []).append(index)
+
+        seen = set()
+        unique = []
+        for pattern, index in patterns:
+            if pattern not in seen:
+                seen.add(pattern)
+                unique.append((pattern, index))
+        self._goto, self._fail, out = gamedb.build_automaton(unique)
+        self._out = [tuple(sorted(indexes)) for indexes in out]
+
+    def __len__(self):
+        return len(self.titles)
+
+    def match(self, process_name):
+        if process_name in self.blacklist or process_name in self.excluded:
+            return ()
+
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self.exact.get(process_name, ()))
+        state = 0
+        for ch in process_name:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+
+        if not found:
+            return ()
+        return tuple(dict.fromkeys(self.titles[i] for i in sorted(found)))
+
+
+class ProcessTracker:
+    def __init__(self, source, classify, watch=None):
+        self.source = source
+        self.classify = classify
+        self.watch = watch or (lambda name, classification: False)
+        self.table = {}
+        self.watched = set()
+        self._snapshot = None
+
+    def update(self):
+        pids = set(self.source.pids())
+
+        # pid может достаться новому процессу между тиками; у плееров и игр сверяем время запуска
+        reused = tuple(pid for pid in self.watched & pids if self.source.started(pid) != self.table[pid].create_time)
+
+        exited = tuple(set(self.table) - pids) + reused
+        for pid in exited:
+            del self.table[pid]
+            self.watched.discard(pid)
+
+        started = []
+        for pid in pids - set(self.table):
+            info = self.source.describe(pid)
+            if info is None:
+                continue
+            name = (info[0] or '').lower()
+            self.table[pid] = proc = TrackedProcess(name, info[1], self.classify(name))
+            if self.watch(name, proc.classification):
+                self.watched.add(pid)
+            started.append(pid)
+
+        if started or exited:
+            self._snapshot = None
+        return ProcessDelta(tuple(started), exited)
+
+    def reclassify(self):
+        for pid, proc in self.table.items():
+            self.table[pid] = proc._replace(classification=self.classify(proc.name))
+        self._snapshot = None
+        self.rewatch()
+
+    def rewatch(self):
+        self.watched = {pid for pid, proc in self.table.items() if self.watch(proc.name, proc.classification)}
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = ProcessSnapshot((pid, proc.name) for pid, proc in self.table.items())
+        return self._snapshot
+
+
+class WindowDetector:
+    def __init__(self, source, title_mask):
+        self.source = source
+        self.title_mask = title_mask
+        self.cache = {}
+        self._seen = None
+        self._found = 0
+
+    def set_title_mask(self, title_mask):
+        self.title_mask = title_mask
+        self.cache = {}
+        self._seen = None
+
+    def check(self, title):
+        # окна и так отобраны по процессам браузеров из правил, остальное решает window_title
+        if not title:
+            return 0
+        return self.title_mask(title)
+
+    def scan(self, pids):
+        # источники на событиях ведут счётчик изменений: без новых событий окна не перебираются
+        version = getattr(self.source, 'version', None)
+        if version is not None and self._seen == (version, pids):
+            return self._found
+
+        cache = {}
+        found = 0
+
+        for hwnd in self.source.windows():
+            entry = self.cache.get(hwnd)
+            if entry is None:
+                entry = [self.source.pid(hwnd), None, 0]
+            cache[hwnd] = entry
+
+            allowed = pids.get(entry[0])
+            if not allowed:
+                continue
+
+            title = self.source.title(hwnd)
+            if title != entry[1]:
+                entry[1] = title
+                entry[2] = self.check(title)
+            found |= entry[2] & allowed
+
+        self.cache = cache
+        self._seen = None if version is None else (version, pids)
+        self._found = found
+        return found
+
+
+class DetectionJournal:
+    def __init__(self, path=JOURNAL_FILE, max_bytes=JOURNAL_MAX_BYTES, backups=JOURNAL_BACKUPS,
+                 flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._seen = set()
+        self._state = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record_match(self, process_name, games):
+        key = (process_name, games)
+        if key in self._seen:
+            return False
+        if len(self._seen) >= JOURNAL_SEEN_LIMIT:
+            self._seen.clear()
+        self._seen.add(key)
+        self._append(f"{process_name} (сопоставлен с игрой: {', '.join(games)})")
+        return True
+
+    def record_state(self, state):
+        if state == self._state:
+            return
+        self._state = dict(state)
+        self._append("Состояние: " + ", ".join(f"{key}={value}" for key, value in state.items()))
+
+    def _append(self, line):
+        with self._lock:
+            self._buffer.append(f"{time.ctime()}: {line}\n")
+            if len(self._buffer) >= JOURNAL_BATCH:
+                self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        try:
+            self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        except OSError as e:
+            logger.error(f"Не удалось записать журнал {self.path}: {e}")
+
+    def _rotate(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+
+class RecordingWindowSource:
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.pids = {}
+        self.current = None
+
+    def windows(self):
+        hwnds = self.inner.windows()
+        self.current = {hwnd: [self.pids.get(hwnd), None] for hwnd in hwnds}
+        return hwnds
+
+    def pid(self, hwnd):
+        pid = self.pids[hwnd] = self.inner.pid(hwnd)
+        if self.current is not None and hwnd in self.current:
+            self.current[hwnd][0] = pid
+        return pid
+
+    def title(self, hwnd):
+        title = self.inner.title(hwnd)
+        if self.current is not None and hwnd in self.current:
+            self.current[hwnd][1] = title
+        return title
+
+    def take(self):
+        current, self.current = self.current, None
+        return current
+
+
+class RecordingAudioBackend:
+    def __init__(self, inner, trace):
+        self.inner = inner
+        self.trace = trace
+        self.name = inner.name
+        self.meter_pids = {}
+
+    def attach_thread(self):
+        self.inner.attach_thread()
+
+    def sessions(self):
+        sessions = self.inner.sessions()
+        self.trace.sessions(sessions)
+        return sessions
+
+    def set_volume(self, handle, volume):
+        self.inner.set_volume(handle, volume)
+
+    def meters(self):
+        meters = self.inner.meters()
+        self.meter_pids = {id(meter): pid for pid, meter in meters.items()}
+        return meters
+
+    def peak(self, meter):
+        level = self.inner.peak(meter)
+        self.trace.level(self.meter_pids.get(id(meter)), level)
+        return level
+
+
+class TraceRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.processes = {}
+        self.windows = {}
+        self.session_pids = None
+        self.levels = {}
+        self.line = {}
+        self.last = None
+        self.state = None
+        self.throttle = 1.0
+        self.ticks = 0
+        atexit.register(self.close)
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def start(self, controller):
+        self.write({
+            'trace': 1,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'settings': dict(config.section),
+            'players': config.players(),
+            'activity': controller.activity is not None,
+            'games': controller.games_lines(),
+            'rules': controller.rules_text,
+        })
+        self.window_source = controller.monitor.windows.source
+
+    def wake(self):
+        with self.lock:
+            self.line['e'] = 1
+
+    def wake_windows(self):
+        with self.lock:
+            self.line['ew'] = 1
+
+    def reload(self, key, value):
+        with self.lock:
+            self.line[key] = value
+
+    def sessions(self, sessions):
+        pids = sorted(sessions)
+        with self.lock:
+            if pids != self.session_pids:
+                self.session_pids = pids
+                self.line['s'] = pids
+
+    def level(self, pid, level):
+        level = round(level, 3)
+        with self.lock:
+            if pid is not None and self.levels.get(pid) != level:
+                self.levels[pid] = level
+                self.line.setdefault('a', {})[pid] = level
+
+    def record(self, controller, now):
+        table = controller.monitor.tracker.table
+        current = dict(zip(controller.snapshot.pids, controller.snapshot.names))
+        # pid с новым именем означает, что его занял другой процесс
+        started = [[pid, name, getattr(table.get(pid), 'create_time', 0.0)] for pid, name in current.items()
+                   if self.processes.get(pid) != name]
+        exited = [pid for pid in self.processes if pid not in current]
+        for pid, name, create_time in started:
+            self.processes[pid] = name
+        for pid in exited:
+            del self.processes[pid]
+
+        with self.lock:
+            line, self.line = self.line, {}
+        line['dt'] = 0 if self.last is None else round((now - self.last) * 1e6)
+        self.last = now
+        if started:
+            line['p+'] = started
+        if exited:
+            line['p-'] = exited
+
+        windows = self.window_source.take() if isinstance(self.window_source, RecordingWindowSource) else None
+        if windows is not None:
+            changed = [[hwnd, pid, title] for hwnd, (pid, title) in windows.items() if self.windows.get(hwnd) != (pid, title)]
+            closed = [hwnd for hwnd in self.windows if hwnd not in windows]
+            self.windows = {hwnd: (pid, title) for hwnd, (pid, title) in windows.items()}
+            if changed:
+                line['w+'] = changed
+            if closed:
+                line['w-'] = closed
+
+        if controller.scheduler.throttle != self.throttle:
+            self.throttle = line['th'] = controller.scheduler.throttle
+        if controller.last_state != self.state:
+            self.state = controller.last_state
+            line['d'] = self.state
+
+        self.write(line)
+        self.ticks += 1
+        if self.ticks % TRACE_FLUSH_TICKS == 0:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
 
 
 class ProcessMonitor:
-    def __init__(self):
+    def __init__(self, source=None, window_source=None, journal=None):
         self.blacklist = {
             "locationnotificationwindows.exe",
             "rzdiagnostic",
@@ -47,135 +1175,988 @@ class ProcessMonitor:
             "EnumWindows",
             "rvcontrolsvc.exe"
         }
+        self.players = frozenset([music.lower()])
+        self.matcher = GameMatcher((), self.blacklist)
+        self.classify = functools.lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._classify)
+        self.tracker = ProcessTracker(source or create_process_source(), self.classify, self.is_watched)
+        self.last_delta = ProcessDelta((), ())
+        self._found_for = None
+        self._found = {}
+        self.journal = journal or DetectionJournal()
+        self._journaled = None
+        self.rules = rules.DecisionTable(rules.load_rules(rules.DEFAULT_RULES_FILE))
+        self.windows = WindowDetector(window_source or create_window_source(WINDOW_SOURCE), self.rules.title_mask)
+        self._browsers_for = None
+        self._browsers = {}
 
-    def is_music_player_running(self):
-        for proc in psutil.process_iter(['name']):
-            if proc.info['name'].lower() == music.lower():
-                return True
-        return False
+    def set_players(self, names):
+        self.players = frozenset(name.lower() for name in names)
+        self.tracker.rewatch()
 
-    def is_game_running(self, games):
-        false_positives = []
+    def set_games(self, games):
+        previous = self.matcher
+        self.matcher = games if hasattr(games, 'match') else GameMatcher(games, self.blacklist)
+        self.classify.cache_clear()
+        self.tracker.reclassify()
+        if previous is not self.matcher and hasattr(previous, 'close'):
+            previous.close()
 
-        for game in games:
-            game_lower = game.lower()
-            for process in psutil.process_iter(['name']):
-                process_name = process.info['name'].lower()
+    def set_rules(self, table):
+        self.rules = table
+        self.windows.set_title_mask(table.title_mask)
+        self._browsers_for = None
+        self.classify.cache_clear()
+        self.tracker.reclassify()
 
-                if process_name in self.blacklist:
-                    continue
+    def is_watched(self, name, classification):
+        return bool(classification.games) or name in self.players
+
+    def _classify(self, process_name):
+        return Classification(self.matcher.match(process_name), process_name in self.rules.browser_masks)
+
+    def snapshot(self):
+        self.last_delta = self.tracker.update()
+        return self.tracker.snapshot
+
+    def is_relevant(self, pid, started, name=None):
+        if name is None:
+            if started:
+                info = self.tracker.source.describe(pid)
+                name = info[0] if info else None
+            else:
+                proc = self.tracker.table.get(pid)
+                name = proc.name if proc else None
+
+        if not name:
+            return False
+
+        name = name.lower()
+        if name in self.players:
+            return True
+        classification = self.classify(name)
+        return bool(classification.games) or classification.browser or bool(self.rules.process_mask(name))
+
+    def running_players(self, snapshot):
+        return tuple(sorted(name for name in self.players if name in snapshot.by_name))
+
+    def is_music_player_running(self, snapshot):
+        return bool(self.running_players(snapshot))
+
+    def find_games(self, snapshot):
+        if snapshot is self._found_for:
+            return self._found
+
+        found = {}
+        for process_name in snapshot.by_name:
+            games = self.classify(process_name).games
+            if games:
+                found[process_name] = games
 
-                if game_lower in process_name or process_name.startswith(game_lower):
-                    logger.debug(f"Найден процесс: {process_name} (сопоставлен с игрой: {game})")
-                    false_positives.append(process_name)
+        self._found_for = snapshot
+        self._found = found
+        return found
 
-        if false_positives:
-            logger.warning(f"Возможные ложные срабатывания: {', '.join(set(false_positives))}")
-            with open('false_positives.txt', 'a', encoding='utf-8') as f:
-                f.write(f"{time.ctime()}: {', '.join(set(false_positives))}\n")
+    def is_game_running(self, snapshot):
+        found = self.find_games(snapshot)
 
-        return len(false_positives) > 0
+        if found is not self._journaled:
+            self._journaled = found
+            for process_name, games in found.items():
+                if self.journal.record_match(process_name, games):
+                    logger.warning("Возможное ложное срабатывание: {} (сопоставлен с игрой: {})", process_name, ", ".join(games))
 
-    def is_youtube_opened(self):
+        return bool(found)
+
+    def window_mask(self, snapshot):
         try:
-            browser_processes = []
-            for proc in psutil.process_iter(['pid', 'name']):
-                if proc.info['name'].lower() in ['chrome.exe', 'msedge.exe', 'firefox.exe']:
-                    browser_processes.append(proc.info['pid'])
+            if snapshot is not self._browsers_for:
+                self._browsers_for = snapshot
+                self._browsers = self.rules.window_pids(snapshot)
+            return self.windows.scan(self._browsers)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке окон: {e}")
+            return 0
+
+    def is_youtube_opened(self, snapshot):
+        return bool(self.window_mask(snapshot))
+
+
+class PollingEventSource:
+    name = 'poll'
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._process = False
+        self._poked = False
+
+    def start(self, relevant):
+        self.relevant = relevant
+        return self
+
+    def wait(self, timeout):
+        # (событие процесса, пробуждение извне); оба False - вышел таймаут
+        self._wake.wait(timeout)
+        self._wake.clear()
+        process, self._process = self._process, False
+        poked, self._poked = self._poked, False
+        return process, poked
+
+    def wake(self):
+        self._poked = True
+        self._wake.set()
+
+    def close(self):
+        pass
 
-            def check_window(hwnd, pid):
-                try:
-                    if not win32gui.IsWindowVisible(hwnd):
-                        return False
 
-                    _, window_pid = win32process.GetWindowThreadProcessId(hwnd)
-                    if window_pid != pid:
-                        return False
+class _ThreadedEventSource(ThreadedSource, PollingEventSource):
+    thread_prefix = 'events'
+    label = "Источник событий"
 
-                    title = win32gui.GetWindowText(hwnd)
-                    if not title:
-                        return False
+    def start(self, relevant):
+        self.relevant = relevant
+        return super().start()
 
-                    return (('youtube' in title.lower() or 'ютуб' in title.lower()) and 
-                            (' - ' in title and ('chrome' in title.lower() or 
-                             'edge' in title.lower() or 'firefox' in title.lower())))
-                except:
-                    return False
+    def _notify(self, pid, started, name=None):
+        if self.relevant(pid, started, name):
+            self._process = True
+            self._wake.set()
 
-            for pid in browser_processes:
+
+class ProcDiffEventSource(_ThreadedEventSource):
+    name = 'procdiff'
+
+    def __init__(self, interval=0.05, root='/proc'):
+        super().__init__()
+        self.interval = interval
+        self.root = root
+
+    def _scan(self):
+        return {int(entry) for entry in os.listdir(self.root) if entry.isdigit()}
+
+    def _run(self):
+        last = self._scan()
+        self._ready.set()
+        while not self._stop.wait(self.interval):
+            current = self._scan()
+            if current == last:
+                continue
+            for pid in current - last:
+                self._notify(pid, True)
+            for pid in last - current:
+                self._notify(pid, False)
+            last = current
+
+
+class NetlinkEventSource(_ThreadedEventSource):
+    name = 'netlink'
+
+    NETLINK_CONNECTOR = 11
+    CN_IDX_PROC = 1
+    CN_VAL_PROC = 1
+    NLMSG_DONE = 3
+    PROC_CN_MCAST_LISTEN = 1
+    PROC_CN_MCAST_IGNORE = 2
+    PROC_EVENT_EXEC = 0x00000002
+    PROC_EVENT_EXIT = 0x80000000
+
+    def _control(self, sock, op):
+        payload = struct.pack('=I', op)
+        cn_msg = struct.pack('=IIIIHH', self.CN_IDX_PROC, self.CN_VAL_PROC, 0, 0, len(payload), 0) + payload
+        header = struct.pack('=IHHII', 16 + len(cn_msg), self.NLMSG_DONE, 0, 0, os.getpid())
+        sock.send(header + cn_msg)
+
+    def _run(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_CONNECTOR)
+        try:
+            sock.bind((0, self.CN_IDX_PROC))
+            self._control(sock, self.PROC_CN_MCAST_LISTEN)
+            sock.settimeout(0.5)
+            self._ready.set()
+            while not self._stop.is_set():
                 try:
-                    result = [False]
+                    data = sock.recv(4096)
+                except socket.timeout:
+                    continue
+                self._dispatch(data)
+            self._control(sock, self.PROC_CN_MCAST_IGNORE)
+        finally:
+            sock.close()
 
-                    def callback(hwnd, param):
-                        if check_window(hwnd, param):
-                            result[0] = True
-                            return False
-                        return True
+    def _dispatch(self, data):
+        offset = 0
+        while offset + 16 <= len(data):
+            length = struct.unpack_from('=I', data, offset)[0]
+            if length < 16:
+                break
+            event = offset + 16 + 20
+            if event + 24 <= offset + length:
+                what = struct.unpack_from('=I', data, event)[0]
+                pid, tgid = struct.unpack_from('=II', data, event + 16)
+                if pid == tgid:
+                    if what == self.PROC_EVENT_EXEC:
+                        self._notify(pid, True)
+                    elif what == self.PROC_EVENT_EXIT:
+                        self._notify(pid, False)
+            offset += (length + 3) & ~3
 
-                    win32gui.EnumWindows(callback, pid)
-                    if result[0]:
-                        return True
 
-                except Exception as e:
-                    logger.debug(f"Ошибка при проверке PID {pid}: {e}")
+class WmiEventSource(_ThreadedEventSource):
+    name = 'wmi'
+
+    QUERY = (
+        "SELECT * FROM __InstanceOperationEvent WITHIN 0.2 "
+        "WHERE TargetInstance ISA 'Win32_Process' "
+        "AND (__CLASS = '__InstanceCreationEvent' OR __CLASS = '__InstanceDeletionEvent')"
+    )
+
+    def _run(self):
+        import comtypes
+        import comtypes.client
+
+        comtypes.CoInitialize()
+        try:
+            wmi = comtypes.client.CoGetObject("winmgmts:{impersonationLevel=impersonate}!\\\\.\\root\\cimv2", dynamic=True)
+            events = wmi.ExecNotificationQuery(self.QUERY)
+            self._ready.set()
+            while not self._stop.is_set():
+                try:
+                    event = events.NextEvent(500)
+                except comtypes.COMError:
                     continue
+                process = event.Properties_('TargetInstance').Value
+                started = event.Path_.Class == '__InstanceCreationEvent'
+                self._notify(int(process.ProcessId), started, process.Name)
+        finally:
+            comtypes.CoUninitialize()
 
-            return False
 
+EVENT_SOURCES = (PollingEventSource, ProcDiffEventSource, NetlinkEventSource, WmiEventSource)
+
+
+def create_event_source(kind, relevant):
+    if kind == 'auto':
+        if sys.platform.startswith('linux'):
+            candidates = [NetlinkEventSource, ProcDiffEventSource]
+        elif sys.platform == 'win32':
+            candidates = [WmiEventSource]
+        else:
+            candidates = []
+    else:
+        candidates = [source for source in EVENT_SOURCES if source.name == kind]
+
+    for source in candidates:
+        try:
+            return source().start(relevant)
         except Exception as e:
-            logger.error(f"Ошибка в is_youtube_opened: {e}")
+            logger.warning(f"Источник событий {source.name} недоступен: {e}")
+
+    return PollingEventSource().start(relevant)
+
+
+def timed_call(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def chained_call(processes, deadline, fallback, func, *args):
+    # снимок процессов этого тика ждём не дольше дедлайна тика, иначе берём прошлый;
+    # ожидание не входит во время пробы, чтобы зависший снимок не отбрасывал её результат
+    try:
+        snapshot = processes.result(timeout=max(deadline - time.perf_counter(), 0))[0][0]
+    except Exception:
+        snapshot = fallback
+    return timed_call(func, *args, snapshot)
+
+
+class ProbeSchedule:
+    __slots__ = ('name', 'min_interval', 'max_interval', 'ttl', 'interval',
+                 'next_due', 'value', 'updated', 'runs', 'transitions')
+
+    def __init__(self, name, min_interval, max_interval, ttl):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.ttl = ttl
+        self.interval = min_interval
+        self.next_due = 0.0
+        self.value = None
+        self.updated = None
+        self.runs = 0
+        self.transitions = 0
+
+
+class TickScheduler:
+    def __init__(self, cadence, cpu_budget, backoff=PROBE_BACKOFF, budget_window=CPU_BUDGET_WINDOW):
+        self.probes = {name: ProbeSchedule(name, *params) for name, params in cadence.items()}
+        self.cpu_budget = cpu_budget
+        self.backoff = backoff
+        self.budget_window = budget_window
+        self.throttle = 1.0
+        self.cpu_usage = 0.0
+        self.decisions = deque(maxlen=256)
+        self._budget_mark = (time.monotonic(), time.process_time())
+
+    def due(self, name, now):
+        return now >= self.probes[name].next_due
+
+    def value(self, name):
+        return self.probes[name].value
+
+    def record(self, name, value, now):
+        probe = self.probes[name]
+        previous = probe.interval
+
+        if probe.updated is not None and value != probe.value:
+            probe.interval = probe.min_interval
+            probe.transitions += 1
+        else:
+            probe.interval = min(probe.interval * self.backoff, probe.max_interval)
+
+        probe.value = value
+        probe.updated = now
+        probe.runs += 1
+        probe.next_due = now + min(probe.interval * self.throttle, probe.ttl)
+
+        if probe.interval != previous:
+            self._decide(now, name, f"интервал {previous:.2f}с -> {probe.interval:.2f}с")
+
+    def wake(self, *names):
+        for name in names:
+            self.probes[name].next_due = 0.0
+
+    def next_wakeup(self, now):
+        return max(min(probe.next_due for probe in self.probes.values()) - now, MIN_TICK_SLEEP)
+
+    def check_budget(self, now):
+        mark_wall, mark_cpu = self._budget_mark
+        elapsed = now - mark_wall
+        if elapsed < self.budget_window:
+            return
+
+        cpu = time.process_time()
+        self.cpu_usage = (cpu - mark_cpu) / elapsed
+        self._budget_mark = (now, cpu)
+
+        previous = self.throttle
+        if self.cpu_usage > self.cpu_budget:
+            self.throttle = min(self.throttle * 2, MAX_THROTTLE)
+        elif self.cpu_usage < self.cpu_budget / 2:
+            self.throttle = max(self.throttle / 2, 1.0)
+
+        if self.throttle != previous:
+            self._decide(now, 'budget', f"CPU {self.cpu_usage:.1%} при бюджете {self.cpu_budget:.1%}, множитель {previous:g} -> {self.throttle:g}")
+
+    def _decide(self, now, name, message):
+        self.decisions.append((now, name, message))
+        logger.debug(f"Планировщик [{name}]: {message}")
+
+    def stats(self, now, limit=SCHEDULER_DECISIONS):
+        return {
+            'throttle': self.throttle,
+            'cpu_usage': self.cpu_usage,
+            'probes': {
+                name: {
+                    'interval': probe.interval,
+                    'age': None if probe.updated is None else now - probe.updated,
+                    'runs': probe.runs,
+                    'transitions': probe.transitions,
+                }
+                for name, probe in self.probes.items()
+            },
+            'decisions': [[round(now - at, 3), name, message] for at, name, message in list(self.decisions)[-limit:]],
+        }
+
+
+class ControlServer:
+    def __init__(self, controller):
+        self.controller = controller
+        self.backlog = deque(maxlen=LOG_BACKLOG_LINES)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.listener = None
+        self.handlers = {
+            'status': self.status,
+            'set-volumes': self.set_volumes,
+            'reload-games': self.reload_games,
+            'profile': self.profile,
+            'pause': self.pause,
+            'resume': self.resume,
+            'stop': self.stop,
+        }
+
+    def start(self):
+        self.listener = control.listen()
+        threading.Thread(target=self._accept, name="control", daemon=True).start()
+        logger.info(f"Канал управления: {control.ADDRESS}")
+        return self
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError as e:
+                logger.error(f"Канал управления закрыт: {e}")
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="control-client", daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            while True:
+                message = control.receive(conn)
+                command = message.get('cmd')
+                if command == 'subscribe-logs':
+                    control.send(conn, {'ok': True})
+                    self._stream(conn)
+                    return
+                handler = self.handlers.get(command)
+                if handler is None:
+                    reply = {'ok': False, 'error': f"Неизвестная команда: {command}"}
+                else:
+                    try:
+                        reply = dict(handler(message), ok=True)
+                    except Exception as e:
+                        reply = {'ok': False, 'error': str(e)}
+                control.send(conn, reply)
+        except (EOFError, OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def _stream(self, conn):
+        queue = deque(maxlen=LOG_BACKLOG_LINES)
+        ready = threading.Event()
+        with self.lock:
+            queue.extend(self.backlog)
+            self.subscribers.append((queue, ready))
+        ready.set()
+        try:
+            while True:
+                ready.wait()
+                ready.clear()
+                with self.lock:
+                    lines = list(queue)
+                    queue.clear()
+                if lines:
+                    control.send(conn, {'log': lines})
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.lock:
+                self.subscribers.remove((queue, ready))
+
+    def publish(self, message):
+        line = str(message)
+        with self.lock:
+            self.backlog.append(line)
+            for queue, ready in self.subscribers:
+                queue.append(line)
+                ready.set()
+
+    def status(self, message):
+        controller = self.controller
+        return {
+            'pid': os.getpid(),
+            'player': controller.player,
+            'set_vol': controller.set_vol,
+            'normal_vol': controller.normal_vol,
+            'players': [list(profile) for profile in controller.profiles.values()],
+            'paused': controller.paused,
+            'state': controller.last_state,
+            'events': controller.events.name,
+            'games': len(controller.monitor.matcher),
+            'scheduler': controller.scheduler.stats(time.monotonic()),
+        }
+
+    def set_volumes(self, message):
+        changes = {}
+        for key in ('set_vol', 'normal_vol'):
+            if key in message:
+                changes[key] = f"{float(message[key]):g}"
+                config.set(key, changes[key])
+        config.save()
+        self.controller.post(lambda: self.controller.apply_settings(changes))
+        return {'changes': changes}
+
+    def reload_games(self, message):
+        self.controller.post(lambda: self.controller.reload_games(scan=True))
+        return {}
+
+    def profile(self, message):
+        return {'path': self.controller.profile(float(message.get('seconds', PROFILE_SECONDS)))}
+
+    def pause(self, message):
+        self.controller.post(self.controller.pause)
+        return {}
+
+    def resume(self, message):
+        self.controller.post(self.controller.resume)
+        return {}
+
+    def stop(self, message):
+        self.controller.post(self.controller.stop)
+        return {}
+
+
+_instance_lock = None
+
+
+def acquire_instance_lock():
+    global _instance_lock
+    if sys.platform != 'win32':
+        import fcntl
+        _instance_lock = open(control.LOCK_FILE, 'a')
+        try:
+            fcntl.flock(_instance_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            _instance_lock.close()
+            _instance_lock = None
             return False
+        return True
+    import ctypes
+    _instance_lock = ctypes.windll.kernel32.CreateMutexW(None, False, "Local\\control_music")
+    return ctypes.windll.kernel32.GetLastError() != ERROR_ALREADY_EXISTS
 
 
 class AppController:
-    def __init__(self):
-        self.monitor = ProcessMonitor()
-        self.games = self.load_games()
+    def __init__(self, monitor=None, games=None, audio_backend=None, events=None):
+        self.monitor = monitor or ProcessMonitor()
+        self.trace = None
+        self.games_list = None if games is None else list(games)
+        self.launchers = launchers.LibraryScanner(LAUNCHERS_CACHE) if LAUNCHER_SCAN and games is None else None
+        self.launchers_lock = threading.Lock()
+        self.launchers_due = time.monotonic() + LAUNCHER_SCAN_INTERVAL
+        self.monitor.set_games(self.load_games() if games is None else self.games_list)
+        self.games_watch = FileWatch(GAMES_FILE) if games is None else None
+        self.rules_watch = FileWatch(RULES_FILE)
+        self.load_rules()
+        self.events = events or create_event_source(EVENT_SOURCE, self.monitor.is_relevant)
+        self.trace = TraceRecorder(TRACE_FILE) if TRACE_FILE else None
+        backend = audio_backend or create_audio_backend()
+        if self.trace is not None:
+            backend = RecordingAudioBackend(backend, self.trace)
+            self.monitor.windows.source = RecordingWindowSource(self.monitor.windows.source)
+        self.volume = VolumeController(backend)
+        self.activity = ActivityMeter(self.volume.backend) if ACTIVITY_DUCKING else None
+        cadence = dict(PROBE_CADENCE, audio=AUDIO_PROBE_CADENCE) if self.activity else PROBE_CADENCE
+        self.scheduler = TickScheduler(cadence, CPU_BUDGET)
+        window_source = getattr(self.monitor.windows.source, 'inner', self.monitor.windows.source)
+        if isinstance(window_source, EventWindowSource):
+            window_source.on_change = self.on_windows_changed
+        self.ramp = RampWorker(self.volume, on_applied=self.on_volume_applied)
         self.last_state = None
+        self.paused = False
+        self.running = True
+        self.commands = deque()
+        self.snapshot = self.monitor.tracker.snapshot
+        self.inflight = {}
+        self.profiler = SamplingProfiler()
+        self.thread_id = threading.main_thread().ident
+        self.apply_settings()
+        if self.trace is not None:
+            self.trace.start(self)
+            logger.info(f"Запись трассы в {self.trace.path}")
 
     def load_games(self):
-        try:
-            with open(GAMES_FILE, 'r', encoding='utf-8') as file:
-                return [line.strip() for line in file if line.strip()]
-        except FileNotFoundError:
+        if not os.path.exists(GAMES_FILE):
             logger.error(f"Файл {GAMES_FILE} не найден. Создан новый файл.")
             with open(GAMES_FILE, 'w', encoding='utf-8') as file:
                 file.write("")
-            return []
+
+        self.scan_launchers()
+        started = time.perf_counter()
+        db = gamedb.open_games(self.games_sources(), GAMES_DB, self.monitor.blacklist)
+        logger.info(f"База игр {GAMES_DB}: {len(db)} записей, {(time.perf_counter() - started) * 1000:.1f} мс")
+        return db
+
+    def apply_settings(self, changes=None):
+        self.set_vol = float(config.get('set_vol', '0'))
+        self.normal_vol = float(config.get('normal_vol', '100'))
+        self.player = config.get('player_version', 'Свой вариант')
+        self.volume.name = self.player
+
+        self.profiles = {}
+        for name, set_vol, normal_vol in [(self.player, self.set_vol, self.normal_vol)] + config.players():
+            self.profiles.setdefault(name.lower(), PlayerProfile(name, set_vol, normal_vol))
+        self.monitor.set_players(self.profiles)
+
+        if changes:
+            logger.info(f"Настройки обновлены: {', '.join(f'{key}={value}' for key, value in changes.items())}")
+            self.last_state = None
+            self.scheduler.wake(*self.scheduler.probes)
+            if self.trace is not None:
+                self.trace.reload('cfg', {'settings': dict(config.section), 'players': config.players(),
+                                          'changes': changes})
+
+    def load_rules(self, text=None):
+        try:
+            if text is None:
+                text = rules.read_rules(RULES_FILE)
+            table = rules.DecisionTable(rules.parse_rules(text, RULES_FILE))
+        except Exception as e:
+            logger.error(f"Ошибка в {RULES_FILE}, оставлены прежние правила: {e}")
+            return
+        self.monitor.set_rules(table)
+        self.rules_text = text
+        self.last_state = None
+        if self.trace is not None:
+            self.trace.reload('rules', text)
+        logger.info(f"Правила приглушения: {', '.join(f'{rule.name}({rule.priority})' for rule in table.rules)}")
+
+    def games_sources(self):
+        if self.launchers is not None and os.path.exists(LAUNCHERS_FILE):
+            return GAMES_FILE, LAUNCHERS_FILE
+        return GAMES_FILE,
+
+    def scan_launchers(self):
+        if self.launchers is None:
+            return
+        started = time.perf_counter()
+        with self.launchers_lock:
+            try:
+                changed = launchers.update(LAUNCHERS_FILE, self.launchers)
+            except Exception as e:
+                logger.error(f"Не удалось просканировать библиотеки игр: {e}")
+                return
+        logger.log('INFO' if changed else 'DEBUG',
+                   f"Библиотеки игр: {len(self.launchers.entries)} манифестов, разобрано {self.launchers.parsed}, "
+                   f"{(time.perf_counter() - started) * 1000:.1f} мс")
+
+    def reload_games(self, scan=False):
+        threading.Thread(target=self.rebuild_games, args=(scan,), name="games-db", daemon=True).start()
+
+    def rebuild_games(self, scan=False):
+        if scan:
+            self.scan_launchers()
+        try:
+            built = gamedb.prepare(self.games_sources(), GAMES_DB)
+        except Exception as e:
+            logger.error(f"Не удалось собрать базу игр: {e}")
+            return
+        if built is None:
+            logger.debug("Список игр не изменился")
+            return
+        self.post(lambda: self.swap_games(built))
+
+    def swap_games(self, built):
+        gamedb.install(built, GAMES_DB, self.monitor.matcher)
+        self.monitor.set_games(gamedb.GameDatabase(GAMES_DB, self.monitor.blacklist))
+        self.last_state = None
+        self.scheduler.wake('game')
+        logger.info(f"Список игр обновлён: {len(self.monitor.matcher)} записей")
+        if self.trace is not None:
+            self.trace.reload('games', self.games_lines())
+
+    def games_lines(self):
+        if self.games_list is not None:
+            return self.games_list
+        return [line.rstrip('\n') for line in gamedb.read_lines(self.games_sources())]
+
+    def post(self, command):
+        self.commands.append(command)
+        self.events.wake()
+
+    def run_commands(self):
+        while self.commands:
+            self.commands.popleft()()
+
+    def pause(self):
+        self.paused = True
+        self.ramp.submit(self.targets('normal'))
+        logger.info("Мониторинг приостановлен")
+
+    def resume(self):
+        self.paused = False
+        self.last_state = None
+        self.scheduler.wake(*self.scheduler.probes)
+        logger.info("Мониторинг возобновлён")
+
+    def on_windows_changed(self):
+        self.scheduler.wake('window')
+        if self.trace is not None:
+            self.trace.wake_windows()
+        self.events.wake()
+
+    def profiled_threads(self):
+        # сам монитор и потоки проб асинхронного ядра; остальные потоки почти всё время спят
+        names = {self.thread_id: 'monitor'}
+        for thread in threading.enumerate():
+            if thread.name.startswith('probe'):
+                names[thread.ident] = 'probe'
+        return names
+
+    def profile(self, seconds=PROFILE_SECONDS):
+        directory = os.path.dirname(os.path.abspath(LOG_FILE))
+        path = os.path.join(directory, time.strftime('profile-%Y%m%d-%H%M%S.folded'))
+        return self.profiler.start(seconds, path, self.profiled_threads)
+
+    def stop(self):
+        self.running = False
+        logger.info("Остановка по команде")
+
+    def check_files(self):
+        changes = config.poll()
+        if changes:
+            self.apply_settings(changes)
+        if self.games_watch is not None and self.games_watch.changed():
+            self.reload_games()
+        if self.launchers is not None and time.monotonic() >= self.launchers_due:
+            self.launchers_due = time.monotonic() + LAUNCHER_SCAN_INTERVAL
+            self.reload_games(scan=True)
+        if self.rules_watch.changed():
+            self.load_rules()
+            self.scheduler.wake(*self.scheduler.probes)
+
+    def targets(self, volume):
+        snapshot = self.snapshot
+        targets = []
+        for key, profile in self.profiles.items():
+            pids = snapshot.by_name.get(key)
+            if pids:
+                level = profile.set_vol if volume == 'quiet' else profile.normal_vol if volume == 'normal' else volume
+                targets.append(VolumeTarget(profile.name, level, pids))
+        return targets
+
+    def on_volume_applied(self, command_id, targets, elapsed):
+        if targets:
+            metrics.observe('transition_seconds', elapsed)
+        else:
+            metrics.inc('transition_empty_total')
+
+    def probe_processes(self):
+        snapshot = self.monitor.snapshot()
+        mark = time.perf_counter()
+        players = self.monitor.running_players(snapshot)
+        game_running = self.monitor.is_game_running(snapshot)
+        metrics.observe('probe_seconds', time.perf_counter() - mark, 'game_match')
+        return snapshot, self.monitor.last_delta, players, game_running
+
+    def apply_processes(self, result, now):
+        snapshot, delta, players, game_running = result
+        self.snapshot = snapshot
+        self.apply_delta(delta)
+        self.scheduler.record('player', players, now)
+        self.scheduler.record('game', game_running, now)
+
+    def apply_delta(self, delta):
+        if delta.started or delta.exited:
+            logger.debug(f"Процессы: запущено {len(delta.started)}, завершено {len(delta.exited)}")
+            self.volume.forget(delta.exited)
+            if self.activity is not None:
+                self.activity.refresh()
+
+    def probe_windows(self, snapshot=None):
+        return self.monitor.window_mask(self.snapshot if snapshot is None else snapshot)
+
+    def apply_windows(self, mask, now):
+        self.scheduler.record('window', mask, now)
+
+    def probe_audio(self, now, snapshot=None):
+        players = (self.snapshot if snapshot is None else snapshot).pids_for(self.profiles)
+        return self.activity.sample(frozenset(players), now)
+
+    def apply_audio(self, active, now):
+        self.scheduler.record('audio', active, now)
+        metrics.set('audio_envelope', self.activity.envelope)
+
+    def due_probes(self, now):
+        scheduler = self.scheduler
+        probes = []
+        if scheduler.due('player', now) or scheduler.due('game', now):
+            probes.append(('process_scan', self.probe_processes, (), self.apply_processes))
+        if scheduler.due('window', now):
+            probes.append(('window_scan', self.probe_windows, (), self.apply_windows))
+        if self.activity is not None and scheduler.due('audio', now):
+            probes.append(('audio_meter', self.probe_audio, (now,), self.apply_audio))
+        return probes
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        started = time.perf_counter()
+        self.run_commands()
+        self.check_files()
+        if self.paused:
+            return
+
+        for name, probe, args, apply in self.due_probes(now):
+            mark = time.perf_counter()
+            result = probe(*args)
+            metrics.observe('probe_seconds', time.perf_counter() - mark, name)
+            apply(result, now)
+
+        self.decide(now)
+        self.finish_tick(now, started)
+
+    async def tick_async(self, executor, now=None):
+        now = time.monotonic() if now is None else now
+        started = time.perf_counter()
+        # перезагрузки и команды меняют таблицы, которые читает ещё не завершённая проба
+        if not any(not entry[4] for entry in self.inflight.values()):
+            self.run_commands()
+            self.check_files()
+        if self.paused:
+            return
+
+        waiting = []
+        processes = None
+        for name, probe, args, apply in self.due_probes(now):
+            if name in self.inflight:
+                metrics.inc('probe_skipped_total')
+                continue
+            if processes is not None:
+                # окна и звук проверяются по снимку процессов этого же тика
+                future = executor.submit(chained_call, processes, started + TICK_DEADLINE, self.snapshot, probe, *args)
+            else:
+                future = executor.submit(timed_call, probe, *args)
+            if name == 'process_scan':
+                processes = future
+            wrapped = asyncio.wrap_future(future)
+            waiting.append(wrapped)
+            self.inflight[name] = [wrapped, time.perf_counter(), apply, now, False]
+
+        remaining = TICK_DEADLINE - (time.perf_counter() - started)
+        waited = time.perf_counter()
+        if waiting and remaining > 0:
+            await asyncio.wait(waiting, timeout=remaining)
+        waited = time.perf_counter() - waited
+
+        for name, entry in list(self.inflight.items()):
+            future, launched, apply, probe_now, expired = entry
+            if not future.done():
+                if not expired and time.perf_counter() - launched > PROBE_TIMEOUT:
+                    entry[4] = True
+                    metrics.inc('probe_timeouts_total')
+                    logger.warning(f"Проверка {name} не ответила за {PROBE_TIMEOUT:g} с, результат будет отброшен")
+                continue
+
+            del self.inflight[name]
+            try:
+                result, elapsed = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка проверки {name}: {e}")
+                continue
+            metrics.observe('probe_seconds', elapsed, name)
+            if expired or elapsed > PROBE_TIMEOUT:
+                logger.debug(f"Поздний результат {name} отброшен ({elapsed:.2f} с)")
+                if name == 'process_scan':
+                    # трекер уже учёл эти процессы, следующий снимок их разницу не повторит
+                    self.apply_delta(result[1])
+                continue
+            apply(result, probe_now)
+
+        self.decide(now)
+        self.finish_tick(now, started, late=tuple(self.inflight), waited=waited)
+
+    def decide(self, now):
+        scheduler = self.scheduler
+        table = self.monitor.rules
+        player_running = scheduler.value('player')
+        rule = table.evaluate(table.snapshot_mask(self.snapshot),
+                              scheduler.value('window') or 0, scheduler.value('game'))
+
+        current_state = {
+            'player': player_running,
+            'rule': rule.name if rule else None
+        }
+        if self.activity is not None:
+            current_state['audio'] = scheduler.value('audio')
+            if rule is not None and rule.volume != 'normal' and not current_state['audio']:
+                # правило сработало бы, но в других сессиях тихо: в журнал и статус оно не попадает
+                current_state['rule'] = None
+                current_state['suppressed'] = rule.name
+                rule = None
+
+        if current_state != self.last_state:
+            if not player_running:
+                logger.debug(f"Плееры не запущены: {', '.join(profile.name for profile in self.profiles.values())}")
+            elif rule is not None and rule.volume != 'normal':
+                self.ramp.submit(self.targets(rule.volume))
+                logger.info(f"Тихий режим | Правило: {rule.name} | Громкость: {rule.volume} | Плееры: {', '.join(player_running)}")
+            else:
+                self.ramp.submit(self.targets('normal'))
+                suppressed = f" (подавлено: {current_state['suppressed']})" if 'suppressed' in current_state else ''
+                logger.info(f"Нормальная громкость | Правило: {current_state['rule'] or '-'}{suppressed} | "
+                            f"Звук: {current_state.get('audio', '-')} | Плееры: {', '.join(player_running)}")
+
+            metrics.inc('transitions_total')
+            self.monitor.journal.record_state(current_state)
+            self.last_state = current_state
+
+    def finish_tick(self, now, started, late=(), waited=0.0):
+        scheduler = self.scheduler
+        scheduler.check_budget(now)
+        metrics.inc('ticks_total')
+        metrics.set('throttle', scheduler.throttle)
+        metrics.set('cpu_usage', scheduler.cpu_usage)
+        for name, probe in scheduler.probes.items():
+            metrics.set(f'interval_{name}', probe.interval)
+
+        elapsed = time.perf_counter() - started
+        metrics.observe('tick_seconds', elapsed)
+        if late:
+            metrics.inc('deadline_misses_total')
+            logger.debug(f"Дедлайн тика: решение принято без {', '.join(late)}")
+        elif elapsed - waited > TICK_DEADLINE:
+            metrics.inc('deadline_misses_total')
+            logger.warning(f"Тик занял {elapsed * 1000:.0f} мс при дедлайне {TICK_DEADLINE * 1000:.0f} мс")
+        if self.trace is not None:
+            self.trace.record(self, now)
+
+    def after_wait(self, woke, expected):
+        process, poked = woke
+        if process:
+            logger.debug("Пробуждение по событию процесса")
+            self.scheduler.wake('player', 'game')
+            if self.trace is not None:
+                self.trace.wake()
+        elif not poked:
+            metrics.observe('tick_jitter_seconds', abs(time.monotonic() - expected))
 
     def run(self):
-        logger.info(f"Запуск приложения с настройками: player={music}, set_vol={SET_VOL}, normal_vol={NORMAL_VOL}")
+        logger.info(f"Запуск приложения с настройками: player={self.player}, set_vol={self.set_vol}, normal_vol={self.normal_vol}, players={len(self.profiles)}, events={self.events.name}, core={CORE}")
         
-        while True:
-            try:
-                player_running = self.monitor.is_music_player_running()
-                youtube_opened = self.monitor.is_youtube_opened()
-                game_running = self.monitor.is_game_running(self.games)
-
-                current_state = {
-                    'player': player_running,
-                    'youtube': youtube_opened,
-                    'game': game_running
-                }
+        serve_metrics()
+        self.thread_id = threading.get_ident()
 
-                if current_state != self.last_state:
-                    if not player_running:
-                        logger.debug(f"{music} не запущен")
-                    elif youtube_opened or game_running:
-                        VolumeController.set_volume(SET_VOL)
-                        logger.info(f"Тихий режим | YouTube: {youtube_opened} | Игра: {game_running}")
-                    else:
-                        VolumeController.set_volume(NORMAL_VOL)
-                        logger.info("Нормальная громкость")
+        if CORE == 'async':
+            asyncio.run(self.run_async())
+            return
 
-                    self.last_state = current_state
+        while self.running:
+            try:
+                self.tick()
 
-                time.sleep(CHECK_INTERVAL)
+                timeout = self.scheduler.next_wakeup(time.monotonic())
+                expected = time.monotonic() + timeout
+                self.after_wait(self.events.wait(timeout), expected)
 
             except Exception as e:
                 logger.error(f"Критическая ошибка: {e}")
                 time.sleep(1)
 
+    async def run_async(self):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe',
+                                      initializer=self.volume.backend.attach_thread)
+        try:
+            while self.running:
+                try:
+                    await self.tick_async(executor)
+
+                    timeout = self.scheduler.next_wakeup(time.monotonic())
+                    expected = time.monotonic() + timeout
+                    self.after_wait(await loop.run_in_executor(None, self.events.wait, timeout), expected)
+
+                except Exception as e:
+                    logger.error(f"Критическая ошибка: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     log_format = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
@@ -183,14 +2164,34 @@ if __name__ == "__main__":
         log_format = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
 
     logger.add(
-        "app.log",
+        LOG_FILE,
         format=log_format,
         rotation="1 MB",
         retention="10 days",
         encoding='utf-8'
     )
 
+    existing = control.connect()
+    if existing is not None or not acquire_instance_lock():
+        if existing is not None:
+            logger.info(f"Монитор уже запущен (PID {existing.request('status').get('pid')})")
+            existing.close()
+        else:
+            logger.info("Монитор уже запущен")
+        sys.exit(0)
+
     logger.info(f"Инициализация приложения. Язык: {LANGUAGE}")
     app = AppController()
+    server = ControlServer(app).start()
+    logger.add(server.publish, format=log_format)
+    def on_profile_signal(signum, frame):
+        try:
+            app.profile()
+        except RuntimeError as e:
+            logger.warning(f"Сигнал профилирования пропущен: {e}")
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, on_profile_signal)
     app.run()
+    server.close()
     
\ No newline at end of file
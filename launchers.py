@@ -0,0 +1,269 @@
+import json
+import os
+import re
+import stat
+import sys
+
+from settings import atomic_write
+
+LAUNCHERS_FILE = 'launchers.txt'
+CACHE_FILE = 'launchers.json'
+CACHE_VERSION = 1
+MAX_DEPTH = 4
+MAX_ENTRIES = 5000
+
+# каталоги и файлы, которые лежат рядом с игрой, но сами игрой не являются
+SKIP_DIRS = frozenset(('_commonredist', 'commonredist', 'redist', 'redistributables', 'directx', 'vcredist',
+                       'dotnet', 'support', '__installer', 'installers', 'prereqs', 'easyanticheat',
+                       'battleye', 'crashreporter', 'tools', 'sdk'))
+SKIP_EXE = re.compile(r'unins|crash|redist|dxsetup|setup|install|updater|report|helper|prereq|'
+                      r'easyanticheat|battleye|be_service|cefprocess|webhelper|touchup|cleanup|'
+                      r'^python|^7z|^dotnet|^vc_', re.IGNORECASE)
+NATIVE_SUFFIXES = ('', '.x86', '.x86_64')
+
+VDF_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])|//[^\n]*|\[[^\]\n]*\]|([^\s{}"]+)')
+VDF_ESCAPES = {'n': '\n', 't': '\t', '\\': '\\', '"': '"'}
+
+
+def vdf_string(value):
+    return re.sub(r'\\(.)', lambda m: VDF_ESCAPES.get(m.group(1), m.group(0)), value)
+
+
+def parse_vdf(text):
+    root = {}
+    stack = [root]
+    key = None
+    for match in VDF_TOKEN.finditer(text):
+        quoted, brace, bare = match.groups()
+        if brace == '{':
+            child = {}
+            if key is not None:
+                stack[-1][key] = child
+            stack.append(child)
+            key = None
+        elif brace == '}':
+            if len(stack) > 1:
+                stack.pop()
+            key = None
+        elif quoted is not None or bare is not None:
+            token = vdf_string(quoted) if quoted is not None else bare
+            if key is None:
+                key = token.lower()
+            else:
+                stack[-1][key] = token
+                key = None
+    return root
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def steam_roots():
+    candidates = []
+    if sys.platform == 'win32':
+        import winreg
+        for hive, key, value in ((winreg.HKEY_CURRENT_USER, r'Software\Valve\Steam', 'SteamPath'),
+                                 (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\WOW6432Node\Valve\Steam', 'InstallPath'),
+                                 (winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Valve\Steam', 'InstallPath')):
+            try:
+                with winreg.OpenKey(hive, key) as handle:
+                    candidates.append(winreg.QueryValueEx(handle, value)[0])
+            except OSError:
+                continue
+    else:
+        home = os.path.expanduser('~')
+        candidates += [os.path.join(home, '.steam', 'steam'),
+                       os.path.join(home, '.local', 'share', 'Steam'),
+                       os.path.join(home, '.var', 'app', 'com.valvesoftware.Steam', '.local', 'share', 'Steam')]
+
+    roots = []
+    for path in candidates:
+        path = os.path.realpath(path)
+        if path not in roots and os.path.isdir(os.path.join(path, 'steamapps')):
+            roots.append(path)
+    return roots
+
+
+def steam_libraries(roots):
+    libraries = []
+    for root in roots:
+        paths = [root]
+        try:
+            folders = parse_vdf(read_text(os.path.join(root, 'steamapps', 'libraryfolders.vdf')))
+        except OSError:
+            folders = {}
+        for entry in folders.get('libraryfolders', {}).values():
+            # старый формат: "1" "D:\\Games\\Steam", новый: "1" { "path" ... }
+            path = entry.get('path') if isinstance(entry, dict) else entry
+            if path and (os.path.isabs(path) or isinstance(entry, dict)):
+                paths.append(path)
+        for path in paths:
+            steamapps = os.path.realpath(os.path.join(path, 'steamapps'))
+            if steamapps not in libraries and os.path.isdir(steamapps):
+                libraries.append(steamapps)
+    return libraries
+
+
+def epic_manifest_dirs():
+    if sys.platform != 'win32':
+        return []
+    data = os.environ.get('PROGRAMDATA', r'C:\ProgramData')
+    path = os.path.join(data, 'Epic', 'EpicGamesLauncher', 'Data', 'Manifests')
+    return [path] if os.path.isdir(path) else []
+
+
+def is_game_binary(entry):
+    name = entry.name.lower()
+    if SKIP_EXE.search(name):
+        return False
+    if name.endswith('.exe'):
+        return True
+    if sys.platform == 'win32' or os.path.splitext(name)[1] not in NATIVE_SUFFIXES:
+        return False
+    try:
+        mode = entry.stat().st_mode
+    except OSError:
+        return False
+    return stat.S_ISREG(mode) and bool(mode & 0o111)
+
+
+def find_executables(directory):
+    found = set()
+    pending = [(directory, 0)]
+    visited = 0
+    while pending and visited < MAX_ENTRIES:
+        path, depth = pending.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        visited += len(entries)
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if depth < MAX_DEPTH and entry.name.lower() not in SKIP_DIRS:
+                    pending.append((entry.path, depth + 1))
+            elif is_game_binary(entry):
+                found.add(entry.name.lower())
+    return sorted(found)
+
+
+def read_steam_manifest(path):
+    state = parse_vdf(read_text(path)).get('appstate', {})
+    title, installdir = state.get('name'), state.get('installdir')
+    if not title or not installdir:
+        return None
+    directory = os.path.join(os.path.dirname(path), 'common', installdir)
+    return title, find_executables(directory)
+
+
+def read_epic_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        item = json.load(f)
+    if item.get('bIsIncompleteInstall') or 'games' not in item.get('AppCategories', ['games']):
+        return None
+    title, executable = item.get('DisplayName'), item.get('LaunchExecutable')
+    if not title or not executable:
+        return None
+    return title, [os.path.basename(executable.replace('\\', '/')).lower()]
+
+
+class LibraryScanner:
+    def __init__(self, cache_path=CACHE_FILE):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.parsed = 0
+        self.changed = False
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('version') == CACHE_VERSION:
+                self.entries = cache['manifests']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def manifests(self):
+        for steamapps in steam_libraries(steam_roots()):
+            yield from self._listing(steamapps, 'appmanifest_', '.acf', read_steam_manifest)
+        for directory in epic_manifest_dirs():
+            yield from self._listing(directory, '', '.item', read_epic_manifest)
+
+    def _listing(self, directory, prefix, suffix, reader):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith(prefix) and entry.name.endswith(suffix):
+                yield entry, reader
+
+    def scan(self):
+        self.parsed = 0
+        self.changed = False
+        entries = {}
+        for entry, reader in self.manifests():
+            try:
+                info = entry.stat()
+            except OSError:
+                continue
+            stamp = [info.st_mtime_ns, info.st_size]
+            cached = self.entries.get(entry.path)
+            if cached is not None and cached[:2] == stamp:
+                entries[entry.path] = cached
+                continue
+
+            self.parsed += 1
+            try:
+                game = reader(entry.path)
+            except (OSError, ValueError):
+                game = None
+            entries[entry.path] = stamp + (list(game) if game else [None, []])
+
+        if entries != self.entries:
+            self.entries = entries
+            self.changed = True
+        return self.games()
+
+    def games(self):
+        games = {}
+        for _, _, title, executables in self.entries.values():
+            if title and executables:
+                games.setdefault(title, set()).update(executables)
+        return games
+
+    def save(self):
+        cache = {'version': CACHE_VERSION, 'manifests': self.entries}
+        atomic_write(self.cache_path, lambda f: json.dump(cache, f, ensure_ascii=False), '.launchers-')
+
+
+def render(games):
+    lines = ["# создаётся автоматически из манифестов Steam и Epic, правки вносите в games.txt\n"]
+    for title in sorted(games, key=str.lower):
+        # '=' отделяет названия от имён файлов, '!' и '#' в начале строки имеют свой смысл
+        name = title.replace('=', '-').lstrip('!#').strip()
+        executables = [exe for exe in sorted(games[title]) if ',' not in exe]
+        if name and executables:
+            lines.append(f"{name} = {', '.join(executables)}\n")
+    return ''.join(lines)
+
+
+def update(path=LAUNCHERS_FILE, scanner=None):
+    scanner = scanner or LibraryScanner()
+    text = render(scanner.scan())
+    if scanner.changed:
+        scanner.save()
+
+    try:
+        current = read_text(path)
+    except OSError:
+        current = None
+    if text == current:
+        return False
+
+    atomic_write(path, lambda f: f.write(text), '.launchers-')
+    return True
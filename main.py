@@ -1,48 +1,70 @@
+import time
+
+STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import configparser
 import os
-import time
 import subprocess
 import threading
 import sys
-from PIL import Image, ImageTk
-import pystray
-import urllib.request
+import itertools
+from collections import deque
+from settings import Settings, atomic_write
+
+IMPORTED = time.perf_counter()
 
 MAIN_ICON_URL = "https://cdn-icons-png.flaticon.com/512/10268/10268970.png"
 HELP_ICON_URL = "https://cdn-icons-png.flaticon.com/512/447/447057.png"
 ICON_FILENAME = "music_control_icon.png"
 HELP_ICON_FILENAME = "help_icon.png"
+METRICS_URL = "http://127.0.0.1:{port}/summary"
+METRICS_REFRESH_MS = 1000
+LOG_BUFFER_LINES = 5000
+LOG_VIEW_LINES = 2000
+LOG_REFRESH_MS = 200
+ICON_CACHE_DIR = "icon_cache"
+ICON_SIZES = (16, 32, 64)
+TRAY_ICON_SIZE = 64
+FADE_STEPS = 20
+FADE_DELAY_MS = 20
+ICON_POLL_MS = 100
+STARTUP_BUDGET_MS = 500
 
-class Config:
-    def __init__(self):
-        self.config = configparser.ConfigParser()
-        self.config.read('config.ini', encoding='utf-8')
-        
-        if 'SETTINGS' not in self.config:
-            self.config['SETTINGS'] = {
-                'player_version': 'Yandex-music(v1)',
-                'set_vol': '50',
-                'normal_vol': '70',
-                'language': 'ru',
-                'window_x': '100',
-                'window_y': '100'
-            }
-    
-    def get(self, key, default=None):
-        return self.config['SETTINGS'].get(key, default)
-    
-    def set(self, key, value):
-        self.config['SETTINGS'][key] = str(value)
-    
-    def save(self):
-        with open('config.ini', 'w', encoding='utf-8') as f:
-            self.config.write(f)
+icon_lock = threading.Lock()
+
+def cached_icon_path(size):
+    return os.path.join(ICON_CACHE_DIR, f"music_control_icon_{size}.png")
+
+def icons_fresh():
+    try:
+        source = os.path.getmtime(ICON_FILENAME)
+        return all(os.path.getmtime(cached_icon_path(size)) >= source for size in ICON_SIZES)
+    except OSError:
+        return False
+
+def prepare_icons():
+    with icon_lock:
+        if icons_fresh():
+            return True
+        try:
+            if not os.path.exists(ICON_FILENAME):
+                import urllib.request
+                urllib.request.urlretrieve(MAIN_ICON_URL, ICON_FILENAME)
+            
+            from PIL import Image
+            os.makedirs(ICON_CACHE_DIR, exist_ok=True)
+            with Image.open(ICON_FILENAME) as image:
+                for size in ICON_SIZES:
+                    icon = image.resize((size, size), Image.Resampling.LANCZOS)
+                    atomic_write(cached_icon_path(size), lambda f: icon.save(f, 'PNG'), '.icon-', binary=True)
+            return True
+        except Exception:
+            return False
 
 class Language:
-    def __init__(self):
-        self.cfg = Config()
+    def __init__(self, cfg):
+        self.cfg = cfg
         self.current_lang = self.cfg.get('language', 'ru')
         self.translations = {
             'ru': {
@@ -60,7 +82,12 @@ class Language:
                 'console_title': "Консоль отладки",
                 'select_lang': "Язык:",
                 'error': "Ошибка",
-                'launch_error': "Не удалось запустить плеер"
+                'launch_error': "Не удалось запустить плеер",
+                'pause': "Пауза / продолжить",
+                'profile': "Профилировать",
+                'extra_players': "Дополнительные плееры:",
+                'add': "Добавить",
+                'remove': "Удалить"
             },
             'en': {
                 'title': "Music Control",
@@ -77,7 +104,12 @@ class Language:
                 'console_title': "Debug Console",
                 'select_lang': "Language:",
                 'error': "Error",
-                'launch_error': "Failed to launch player"
+                'launch_error': "Failed to launch player",
+                'pause': "Pause / resume",
+                'profile': "Profile",
+                'extra_players': "Additional players:",
+                'add': "Add",
+                'remove': "Remove"
             }
         }
     
@@ -113,30 +145,67 @@ class ToolTip:
             self.tip_window.destroy()
         self.tip_window = None
 
+class LogTransport:
+    def __init__(self, maxlen=LOG_BUFFER_LINES):
+        self.lines = deque(maxlen=maxlen)
+        self.total = 0
+        self.lock = threading.Lock()
+    
+    def attach(self, stream):
+        threading.Thread(target=self.drain, args=(stream,), daemon=True).start()
+    
+    def drain(self, stream):
+        for line in stream:
+            self.append(line)
+        stream.close()
+    
+    def append(self, line):
+        with self.lock:
+            self.lines.append(line)
+            self.total += 1
+    
+    def extend(self, lines):
+        with self.lock:
+            self.lines.extend(lines)
+            self.total += len(lines)
+    
+    def since(self, position):
+        with self.lock:
+            available = min(self.total - position, len(self.lines))
+            return self.total, list(itertools.islice(self.lines, len(self.lines) - available, None))
+
 class TrayIcon:
     def __init__(self, master, app):
         self.master = master
         self.app = app
         self.icon = None
-        self.setup_icon()
+        threading.Thread(target=self.setup_icon, daemon=True).start()
     
     def setup_icon(self):
         try:
-            if not os.path.exists(ICON_FILENAME):
-                urllib.request.urlretrieve(MAIN_ICON_URL, ICON_FILENAME)
-            image = Image.open(ICON_FILENAME)
-            image = image.resize((64, 64), Image.Resampling.LANCZOS)
+            self.app.icons_ready = prepare_icons()
+        finally:
+            # окно ждёт этого флага и при неудаче тоже перестаёт опрашивать
+            self.app.icons_done = True
+        
+        import pystray
+        from PIL import Image
+        
+        try:
+            image = Image.open(cached_icon_path(TRAY_ICON_SIZE))
         except:
-            image = Image.new('RGB', (64, 64), '#1E1E1E')
+            image = Image.new('RGB', (TRAY_ICON_SIZE, TRAY_ICON_SIZE), '#1E1E1E')
         
         menu = pystray.Menu(
             pystray.MenuItem(self.app.lang.tr('launch'), self.restore_app),
             pystray.MenuItem(self.app.lang.tr('debug'), self.show_debug),
+            pystray.MenuItem(self.app.lang.tr('pause'), self.toggle_pause),
+            pystray.MenuItem(self.app.lang.tr('profile'), self.app.request_profile),
             pystray.MenuItem("Exit", self.exit_app)
         )
         
         self.icon = pystray.Icon("music_control", image, "Music Control", menu)
-        threading.Thread(target=self.icon.run, daemon=True).start()
+        self.icon.run()
     
     def restore_app(self):
         self.master.after(0, self.master.deiconify)
@@ -145,44 +214,59 @@ class TrayIcon:
     def show_debug(self):
         self.master.after(0, self.app.show_debug_console)
     
+    def toggle_pause(self):
+        import control
+        client = control.connect()
+        if client is None:
+            return
+        try:
+            paused = client.request('status').get('paused')
+            client.request('resume' if paused else 'pause')
+        finally:
+            client.close()
+    
     def exit_app(self):
         self.master.after(0, self.master.destroy)
 
 class MusicControlApp:
     def __init__(self, master):
         self.master = master
-        self.cfg = Config()
-        self.lang = Language()
+        self.cfg = Settings.shared()
+        self.lang = Language(self.cfg)
+        self.icons_ready = icons_fresh()
+        self.icons_done = self.icons_ready
         self.setup_window()
         self.load_icon()
         self.setup_fonts()
         self.create_widgets()
         self.tray_icon = TrayIcon(master, self)
         self.debug_process = None
+        self.debug_owned = False
+        self.log_client = None
+        self.log_transport = LogTransport()
         
         self.master.protocol("WM_DELETE_WINDOW", self.minimize_to_tray)
         self.fade_in()
     
     def setup_window(self):
         self.master.title(self.lang.tr('title'))
-        self.master.geometry(f"400x500+{self.cfg.get('window_x')}+{self.cfg.get('window_y')}")
+        self.master.geometry(f"400x680+{self.cfg.get('window_x')}+{self.cfg.get('window_y')}")
         self.master.resizable(False, False)
         self.master.configure(bg='#1E1E1E')
         self.master.attributes('-alpha', 0)
     
     def load_icon(self):
-        if not os.path.exists(ICON_FILENAME):
-            try:
-                urllib.request.urlretrieve(MAIN_ICON_URL, ICON_FILENAME)
-            except:
-                pass
+        if not self.icons_done:
+            self.master.after(ICON_POLL_MS, self.load_icon)
+            return
+        if not self.icons_ready:
+            return
         
-        if os.path.exists(ICON_FILENAME):
-            try:
-                img = Image.open(ICON_FILENAME)
-                self.master.iconphoto(False, ImageTk.PhotoImage(img))
-            except:
-                pass
+        try:
+            self.icon_images = [tk.PhotoImage(file=cached_icon_path(size)) for size in ICON_SIZES]
+            self.master.iconphoto(False, *reversed(self.icon_images))
+        except:
+            pass
     
     def setup_fonts(self):
         self.title_font = ('Helvetica', 16, 'bold')
@@ -296,6 +380,8 @@ class MusicControlApp:
             )
             scale.pack(side='right', fill='x', expand=True)
         
+        self.create_players_widgets()
+        
         btn_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
         btn_frame.pack(fill='x', pady=(20, 0))
         
@@ -343,6 +429,107 @@ class MusicControlApp:
         
         self.on_player_select()
     
+    def create_players_widgets(self):
+        self.players_label = tk.Label(
+            self.main_frame,
+            text=self.lang.tr('extra_players'),
+            font=self.normal_font,
+            fg='white',
+            bg='#1E1E1E'
+        )
+        self.players_label.pack(anchor='w', pady=(10, 5))
+        
+        self.players = self.cfg.players()
+        self.players_list = tk.Listbox(
+            self.main_frame,
+            height=4,
+            font=self.small_font,
+            bg='#2A2A2A',
+            fg='white',
+            selectbackground='#1DB954',
+            highlightthickness=0,
+            bd=0
+        )
+        self.players_list.pack(fill='x', pady=(0, 5))
+        self.refresh_players()
+        
+        edit_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        edit_frame.pack(fill='x', pady=(0, 5))
+        
+        self.extra_entry = ttk.Entry(edit_frame, font=self.small_font, width=18)
+        self.extra_entry.pack(side='left', fill='x', expand=True)
+        
+        self.extra_normal = tk.Spinbox(edit_frame, from_=0, to=100, width=4, font=self.small_font)
+        self.extra_normal.pack(side='right', padx=(5, 0))
+        self.extra_normal.delete(0, 'end')
+        self.extra_normal.insert(0, self.volumes['normal_vol']['value'].get())
+        
+        self.extra_set = tk.Spinbox(edit_frame, from_=0, to=100, width=4, font=self.small_font)
+        self.extra_set.pack(side='right', padx=(5, 0))
+        self.extra_set.delete(0, 'end')
+        self.extra_set.insert(0, self.volumes['set_vol']['value'].get())
+        
+        players_btn_frame = tk.Frame(self.main_frame, bg='#1E1E1E')
+        players_btn_frame.pack(fill='x')
+        
+        self.add_player_btn = tk.Button(
+            players_btn_frame,
+            text=self.lang.tr('add'),
+            font=self.small_font,
+            bg='#535353',
+            fg='white',
+            bd=0,
+            padx=10,
+            pady=4,
+            command=self.add_player
+        )
+        self.add_player_btn.pack(side='left', padx=(0, 10), fill='x', expand=True)
+        
+        self.remove_player_btn = tk.Button(
+            players_btn_frame,
+            text=self.lang.tr('remove'),
+            font=self.small_font,
+            bg='#535353',
+            fg='white',
+            bd=0,
+            padx=10,
+            pady=4,
+            command=self.remove_player
+        )
+        self.remove_player_btn.pack(side='right', fill='x', expand=True)
+    
+    def refresh_players(self):
+        self.players_list.delete(0, 'end')
+        for name, set_vol, normal_vol in self.players:
+            self.players_list.insert('end', f"{name} — {set_vol:g}/{normal_vol:g}")
+    
+    def add_player(self):
+        name = self.extra_entry.get().strip()
+        try:
+            set_vol = min(max(float(self.extra_set.get()), 0), 100)
+            normal_vol = min(max(float(self.extra_normal.get()), 0), 100)
+        except ValueError:
+            return
+        if not name:
+            return
+        
+        self.players = [player for player in self.players if player[0].lower() != name.lower()]
+        self.players.append((name, set_vol, normal_vol))
+        self.extra_entry.delete(0, 'end')
+        self.save_players()
+    
+    def remove_player(self):
+        selection = self.players_list.curselection()
+        if not selection:
+            return
+        del self.players[selection[0]]
+        self.save_players()
+    
+    def save_players(self):
+        self.refresh_players()
+        self.cfg.set_players(self.players)
+        self.cfg.save()
+    
     def on_player_select(self, event=None):
         if self.player_var.get() == self.lang.tr('custom_player'):
             self.custom_frame.pack(fill='x', pady=(0, 10))
@@ -363,6 +550,10 @@ class MusicControlApp:
         self.volumes['set_vol']['label'] = self.lang.tr('start_vol')
         self.volumes['normal_vol']['label'] = self.lang.tr('normal_vol')
         
+        self.players_label.config(text=self.lang.tr('extra_players'))
+        self.add_player_btn.config(text=self.lang.tr('add'))
+        self.remove_player_btn.config(text=self.lang.tr('remove'))
+        
         self.launch_btn.config(text=self.lang.tr('launch'))
         self.debug_btn.config(text=self.lang.tr('debug'))
         
@@ -389,12 +580,12 @@ class MusicControlApp:
         self.cfg.set('window_y', self.master.winfo_y())
         self.cfg.save()
     
-    def fade_in(self):
-        for alpha in [i/20 for i in range(0, 21)]:
-            if not self.master.winfo_exists(): break
-            self.master.attributes('-alpha', alpha)
-            self.master.update()
-            time.sleep(0.02)
+    def fade_in(self, step=0):
+        if not self.master.winfo_exists():
+            return
+        self.master.attributes('-alpha', step / FADE_STEPS)
+        if step < FADE_STEPS:
+            self.master.after(FADE_DELAY_MS, self.fade_in, step + 1)
     
     def minimize_to_tray(self):
         self.save_config()
@@ -419,18 +610,53 @@ class MusicControlApp:
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
             
-            debug_process = subprocess.Popen(
-                [sys.executable, 'gmain.py'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo
-            )
+            client = self.ensure_monitor(startupinfo=startupinfo)
+            if client is not None:
+                client.close()
+            self.debug_owned = False
             
             subprocess.Popen(player_exe, shell=True, startupinfo=startupinfo)
         except Exception as e:
             messagebox.showerror(self.lang.tr('error'), f"{self.lang.tr('launch_error')}: {str(e)}")
     
+    def start_monitor(self, **kwargs):
+        if self.debug_process is not None and self.debug_process.poll() is None:
+            return False
+        
+        self.debug_process = subprocess.Popen(
+            [sys.executable, 'gmain.py'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            env=dict(os.environ, PYTHONIOENCODING='utf-8'),
+            **kwargs
+        )
+        self.log_transport.attach(self.debug_process.stdout)
+        return True
+    
+    def ensure_monitor(self, **kwargs):
+        import control
+        client = control.connect()
+        if client is None:
+            self.start_monitor(**kwargs)
+            client = control.wait_for_daemon()
+        return client
+    
+    def attach_logs(self):
+        if self.debug_process is not None and self.debug_process.poll() is None:
+            return
+        import control
+        client = control.connect()
+        if client is None:
+            self.start_monitor()
+            self.debug_owned = True
+            return
+        self.log_client = client
+        threading.Thread(target=client.subscribe, args=(self.log_transport.extend,), daemon=True).start()
+    
     def show_debug_console(self):
         if hasattr(self, 'debug_window') and self.debug_window.winfo_exists():
             self.debug_window.lift()
@@ -438,7 +664,7 @@ class MusicControlApp:
         
         self.debug_window = tk.Toplevel(self.master)
         self.debug_window.title(self.lang.tr('console_title'))
-        self.debug_window.geometry("600x400")
+        self.debug_window.geometry("600x560")
         self.debug_window.configure(bg='#1E1E1E')
         
         self.debug_text = scrolledtext.ScrolledText(
@@ -450,37 +676,133 @@ class MusicControlApp:
         )
         self.debug_text.pack(fill='both', expand=True, padx=10, pady=10)
         
+        self.metrics_label = tk.Label(
+            self.debug_window,
+            text='',
+            font=('Consolas', 9),
+            fg='#1DB954',
+            bg='#1E1E1E',
+            justify='left',
+            anchor='w'
+        )
+        self.metrics_label.pack(fill='x', padx=10, pady=(0, 10))
+        
+        self.profile_btn = tk.Button(
+            self.debug_window,
+            text=self.lang.tr('profile'),
+            font=('Consolas', 9),
+            bg='#535353',
+            fg='white',
+            bd=0,
+            padx=10,
+            pady=4,
+            command=lambda: threading.Thread(target=self.request_profile, daemon=True).start()
+        )
+        self.profile_btn.pack(anchor='e', padx=10, pady=(0, 10))
+        self.metrics_summary = ''
+        self.metrics_fetching = False
+        self.poll_metrics()
+        
+        self.log_position = 0
         try:
-            if self.debug_process is None:
-                self.debug_process = subprocess.Popen(
-                    [sys.executable, 'gmain.py'],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    stdin=subprocess.PIPE,
-                    text=True
-                )
-            
-            threading.Thread(target=self.read_debug_output, daemon=True).start()
+            self.attach_logs()
         except Exception as e:
             self.debug_text.insert('end', f"Error: {str(e)}\n")
+        self.render_log()
         
         self.debug_window.protocol("WM_DELETE_WINDOW", self.close_debug)
     
-    def read_debug_output(self):
-        while self.debug_process and self.debug_process.poll() is None:
-            output = self.debug_process.stdout.readline()
-            if output:
-                self.debug_text.insert('end', output)
-                self.debug_text.see('end')
-                self.debug_text.update()
+    def render_log(self):
+        if not self.debug_window.winfo_exists():
+            return
+        
+        self.log_position, lines = self.log_transport.since(self.log_position)
+        if lines:
+            self.debug_text.insert('end', ''.join(lines))
+            excess = int(self.debug_text.index('end-1c').split('.')[0]) - LOG_VIEW_LINES
+            if excess > 0:
+                self.debug_text.delete('1.0', f'{excess + 1}.0')
+            self.debug_text.see('end')
+        
+        self.debug_window.after(LOG_REFRESH_MS, self.render_log)
+    
+    def fetch_metrics(self):
+        try:
+            import urllib.request
+            url = METRICS_URL.format(port=self.cfg.get('metrics_port', '9477'))
+            with urllib.request.urlopen(url, timeout=0.5) as response:
+                self.metrics_summary = response.read().decode('utf-8')
+        except Exception:
+            self.metrics_summary = ''
+        finally:
+            self.metrics_fetching = False
+    
+    def poll_metrics(self):
+        if not self.debug_window.winfo_exists():
+            return
+        self.metrics_label.config(text=self.metrics_summary)
+        if not self.metrics_fetching:
+            self.metrics_fetching = True
+            threading.Thread(target=self.fetch_metrics, daemon=True).start()
+        self.debug_window.after(METRICS_REFRESH_MS, self.poll_metrics)
+    
+    def request_profile(self):
+        import control
+        client = control.connect()
+        if client is None:
+            return
+        try:
+            reply = client.request('profile')
+        finally:
+            client.close()
+        if not reply.get('ok'):
+            self.log_transport.extend([f"{reply.get('error')}\n"])
     
     def close_debug(self):
-        if self.debug_process:
+        if self.debug_process and self.debug_owned:
             self.debug_process.terminate()
             self.debug_process = None
+        if self.log_client is not None:
+            self.log_client.close()
+            self.log_client = None
         self.debug_window.destroy()
 
+def startup_budget(argv):
+    for arg in argv:
+        if arg.startswith('--measure-startup'):
+            value = arg.partition('=')[2]
+            return float(value) if value else STARTUP_BUDGET_MS
+    return None
+
+def measure_startup(root, budget_ms):
+    marks = {'импорт модулей': IMPORTED}
+    
+    def on_map(event):
+        if event.widget is root and 'первая отрисовка' not in marks:
+            marks['первая отрисовка'] = time.perf_counter()
+            root.after(0, on_interactive)
+    
+    def on_interactive():
+        marks['готово к вводу'] = time.perf_counter()
+        total = (marks['готово к вводу'] - STARTED) * 1000
+        for name, mark in marks.items():
+            print(f"{name:<18} {(mark - STARTED) * 1000:8.1f} мс")
+        verdict = "OK" if total <= budget_ms else "ПРЕВЫШЕН"
+        print(f"бюджет {budget_ms:.0f} мс: {verdict}")
+        root.measure_exit_code = 0 if total <= budget_ms else 1
+        root.destroy()
+    
+    root.bind('<Map>', on_map, add='+')
+    return marks
+
 if __name__ == "__main__":
+    budget = startup_budget(sys.argv[1:])
     root = tk.Tk()
+    if budget is not None:
+        marks = measure_startup(root, budget)
     app = MusicControlApp(root)
-    root.mainloop()
\ No newline at end of file
+    if budget is not None:
+        marks['окно создано'] = time.perf_counter()
+    root.mainloop()
+    if budget is not None:
+        sys.exit(getattr(root, 'measure_exit_code', 1))
\ No newline at end of file
@@ -0,0 +1,189 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+from loguru import logger
+
+import gmain
+
+
+class ReplayProcessSource:
+    def __init__(self):
+        self.table = {}
+
+    def pids(self):
+        return list(self.table)
+
+    def describe(self, pid):
+        return self.table.get(pid)
+
+    def started(self, pid):
+        info = self.table.get(pid)
+        return info[1] if info else None
+
+
+class ReplayRamp:
+    def __init__(self):
+        self.commands = []
+
+    def submit(self, targets):
+        self.commands.append(tuple(targets))
+        return len(self.commands)
+
+    def close(self):
+        pass
+
+
+def read_trace(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('trace') != 1:
+            raise ValueError(f"{path}: неизвестный формат трассы")
+        yield header
+        for line in f:
+            yield json.loads(line)
+
+
+def normalize(state):
+    return json.loads(json.dumps(state, ensure_ascii=False))
+
+
+def build_controller(header, games):
+    for key, value in header['settings'].items():
+        gmain.config.set(key, value)
+    gmain.config.set_players(header['players'])
+    gmain.ACTIVITY_DUCKING = header['activity']
+    gmain.TRACE_FILE = ''
+    gmain.LAUNCHER_SCAN = False
+
+    source = ReplayProcessSource()
+    windows = gmain.FakeWindowSource()
+    monitor = gmain.ProcessMonitor(source, windows, gmain.DetectionJournal(os.devnull))
+    backend = gmain.FakeAudioBackend()
+    controller = gmain.AppController(
+        monitor=monitor,
+        games=games if games is not None else header.get('games'),
+        audio_backend=backend,
+        events=gmain.PollingEventSource().start(monitor.is_relevant),
+    )
+    if 'rules' in header:
+        controller.load_rules(header['rules'])
+    controller.ramp.close()
+    controller.ramp = ReplayRamp()
+    # множитель нагрузки берётся из трассы, а не из CPU машины, на которой идёт воспроизведение
+    controller.scheduler.check_budget = lambda now: None
+    return controller, source, windows, backend
+
+
+def replay(path, games=None):
+    entries = read_trace(path)
+    header = next(entries)
+    controller, source, windows, backend = build_controller(header, games)
+
+    now = 0.0
+    timings = []
+    decisions = []
+    mismatches = 0
+    expected = None
+
+    for tick, line in enumerate(entries):
+        now += line['dt'] / 1e6
+        for pid, name, create_time in line.get('p+', ()):
+            source.table[pid] = (name, create_time)
+        for pid in line.get('p-', ()):
+            source.table.pop(pid, None)
+        for hwnd, pid, title in line.get('w+', ()):
+            windows.entries[hwnd] = (pid, title)
+        for hwnd in line.get('w-', ()):
+            windows.entries.pop(hwnd, None)
+        if 's' in line:
+            backend.volumes = {pid: backend.volumes.get(pid, 100.0) for pid in line['s']}
+        for pid, level in line.get('a', {}).items():
+            backend.set_level(int(pid), level)
+        if 'cfg' in line:
+            for key, value in line['cfg']['settings'].items():
+                gmain.config.set(key, value)
+            gmain.config.set_players(line['cfg']['players'])
+            controller.apply_settings(line['cfg']['changes'])
+        if 'rules' in line:
+            controller.load_rules(line['rules'])
+            controller.scheduler.wake(*controller.scheduler.probes)
+        if 'games' in line:
+            controller.monitor.set_games(line['games'])
+            controller.last_state = None
+            controller.scheduler.wake('game')
+        if 'th' in line:
+            controller.scheduler.throttle = line['th']
+        if line.get('e'):
+            controller.scheduler.wake('player', 'game')
+        if line.get('ew'):
+            controller.scheduler.wake('window')
+        if 'd' in line:
+            expected = line['d']
+
+        previous = controller.last_state
+        commands = len(controller.ramp.commands)
+        started = time.perf_counter_ns()
+        controller.tick(now)
+        timings.append(time.perf_counter_ns() - started)
+
+        if controller.last_state != previous or 'd' in line:
+            state = normalize(controller.last_state)
+            targets = [[target.name, target.volume] for command in controller.ramp.commands[commands:]
+                       for target in command]
+            matched = state == expected
+            mismatches += not matched
+            decisions.append({'tick': tick, 'time': round(now, 3), 'state': state,
+                              'targets': targets, 'expected': expected, 'matched': matched})
+
+    return decisions, timings, mismatches
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение трассы gmain.py без обращений к ОС")
+    parser.add_argument('trace', help="файл трассы (trace_file в config.ini)")
+    parser.add_argument('--games', help="список игр вместо games.txt")
+    parser.add_argument('--output', help="JSON с решениями и временем тиков")
+    parser.add_argument('--quiet', action='store_true', help="не печатать решения")
+    args = parser.parse_args()
+
+    logger.remove()
+    games = None
+    if args.games:
+        with open(args.games, 'r', encoding='utf-8') as f:
+            games = [line.strip() for line in f if line.strip()]
+
+    started = time.perf_counter()
+    decisions, timings, mismatches = replay(args.trace, games)
+    elapsed = time.perf_counter() - started
+
+    if not args.quiet:
+        for decision in decisions:
+            marker = '' if decision['matched'] else f"  <-- в трассе: {decision['expected']}"
+            print(f"#{decision['tick']:<6} {decision['time']:>10.3f}с {decision['state']} "
+                  f"{decision['targets']}{marker}")
+
+    print(f"\nТиков: {len(timings)}, решений: {len(decisions)}, расхождений: {mismatches}, "
+          f"воспроизведение: {elapsed:.2f}с")
+    if timings:
+        print(f"Тик: p50={percentile(timings, 0.5) / 1000:.1f}мкс p99={percentile(timings, 0.99) / 1000:.1f}мкс "
+              f"max={max(timings) / 1000:.1f}мкс")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'trace': args.trace, 'decisions': decisions, 'tick_ns': timings,
+                       'mismatches': mismatches}, f, ensure_ascii=False, indent=2)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import configparser
+import fnmatch
+import os
+import re
+from collections import namedtuple
+
+RULES_FILE = 'rules.ini'
+# правила по умолчанию - rules.ini, который поставляется рядом с программой
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), RULES_FILE)
+DEFAULT_BROWSERS = ('chrome.exe', 'msedge.exe', 'firefox.exe')
+CACHE_LIMIT = 4096
+
+Rule = namedtuple('Rule', 'name priority volume processes window_title browsers games')
+
+
+def split_list(value):
+    return tuple(part.strip().lower() for part in value.split(',') if part.strip())
+
+
+def parse_rules(text, source=RULES_FILE):
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_string(text, source)
+
+    rules = []
+    for name in parser.sections():
+        section = parser[name]
+        volume = section.get('volume', 'quiet').strip().lower()
+        if volume not in ('quiet', 'normal'):
+            volume = float(volume)
+        window_title = section.get('window_title')
+        browsers = split_list(section.get('browsers', '')) or (DEFAULT_BROWSERS if window_title else ())
+        rules.append(Rule(
+            name,
+            section.getint('priority', 0),
+            volume,
+            split_list(section.get('processes', '')),
+            re.compile(window_title, re.IGNORECASE) if window_title else None,
+            browsers,
+            section.getboolean('games', False),
+        ))
+    return rules
+
+
+def read_rules(path=RULES_FILE):
+    for candidate in (path, DEFAULT_RULES_FILE):
+        try:
+            with open(candidate, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            continue
+    return ''
+
+
+def load_rules(path=RULES_FILE):
+    return parse_rules(read_rules(path), path)
+
+
+class DecisionTable:
+    def __init__(self, rules):
+        # бит правила равен его месту по приоритету: младший установленный бит и есть сработавшее правило
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+        self.process_patterns = []
+        self.title_patterns = []
+        self.browser_masks = {}
+        self.free_process = self.free_window = self.free_games = 0
+        self.needs_games = 0
+
+        for bit, rule in enumerate(self.rules):
+            flag = 1 << bit
+            if rule.processes:
+                self.process_patterns.append((flag, re.compile('|'.join(fnmatch.translate(p) for p in rule.processes))))
+            else:
+                self.free_process |= flag
+            if rule.window_title is not None:
+                self.title_patterns.append((flag, rule.window_title))
+                for browser in rule.browsers:
+                    self.browser_masks[browser] = self.browser_masks.get(browser, 0) | flag
+            else:
+                self.free_window |= flag
+            if rule.games:
+                self.needs_games |= flag
+            else:
+                self.free_games |= flag
+
+        self.browsers = tuple(self.browser_masks)
+        self._names = {}
+        self._mask_for = None
+        self._mask = 0
+
+    def __len__(self):
+        return len(self.rules)
+
+    def process_mask(self, name):
+        mask = self._names.get(name)
+        if mask is None:
+            mask = 0
+            for flag, pattern in self.process_patterns:
+                if pattern.match(name):
+                    mask |= flag
+            if len(self._names) >= CACHE_LIMIT:
+                self._names.clear()
+            self._names[name] = mask
+        return mask
+
+    def snapshot_mask(self, snapshot):
+        if snapshot is not self._mask_for:
+            mask = 0
+            if self.process_patterns:
+                for name in snapshot.by_name:
+                    mask |= self.process_mask(name)
+            self._mask_for = snapshot
+            self._mask = mask
+        return self._mask
+
+    def window_pids(self, snapshot):
+        pids = {}
+        for name, flags in self.browser_masks.items():
+            for pid in snapshot.by_name.get(name, ()):
+                pids[pid] = pids.get(pid, 0) | flags
+        return pids
+
+    def title_mask(self, title):
+        mask = 0
+        for flag, pattern in self.title_patterns:
+            if pattern.search(title):
+                mask |= flag
+        return mask
+
+    def evaluate(self, process_mask, window_mask, game_running):
+        fired = ((process_mask | self.free_process)
+                 & (window_mask | self.free_window)
+                 & ((self.needs_games if game_running else 0) | self.free_games))
+        if not fired:
+            return None
+        return self.rules[(fired & -fired).bit_length() - 1]
@@ -0,0 +1,161 @@
+import atexit
+import configparser
+import os
+import tempfile
+import threading
+
+CONFIG_FILE = 'config.ini'
+SECTION = 'SETTINGS'
+PLAYERS_SECTION = 'PLAYERS'
+SAVE_DELAY = 0.5
+
+DEFAULTS = {
+    'player_version': 'Yandex-music(v1)',
+    'set_vol': '50',
+    'normal_vol': '70',
+    'language': 'ru',
+    'window_x': '100',
+    'window_y': '100'
+}
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def write_temp(path, write, prefix, suffix='.tmp', binary=False):
+    # временный файл в том же каталоге, чтобы os.replace оставался атомарным
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def atomic_write(path, write, prefix, suffix='.tmp', binary=False):
+    temp_path = write_temp(path, write, prefix, suffix, binary)
+    try:
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class FileWatch:
+    def __init__(self, path):
+        self.path = path
+        self.stamp = file_stamp(path)
+
+    def changed(self):
+        stamp = file_stamp(self.path)
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        return True
+
+
+class Settings:
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path=CONFIG_FILE):
+        key = os.path.abspath(path)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(path)
+            return cls._shared[key]
+
+    def __init__(self, path=CONFIG_FILE, delay=SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.RLock()
+        self.watch = FileWatch(path)
+        self._timer = None
+        self.config = self._read()
+        atexit.register(self.flush)
+
+    def _read(self):
+        config = configparser.ConfigParser()
+        # имена плееров в [PLAYERS] - это имена процессов, регистр сохраняем
+        config.optionxform = str
+        config.read(self.path, encoding='utf-8')
+        if SECTION not in config:
+            config[SECTION] = DEFAULTS
+        return config
+
+    @property
+    def section(self):
+        return self.config[SECTION]
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.config[SECTION].get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.config[SECTION][key] = str(value)
+
+    def players(self):
+        with self.lock:
+            if PLAYERS_SECTION not in self.config:
+                return []
+            entries = list(self.config[PLAYERS_SECTION].items())
+
+        players = []
+        for name, value in entries:
+            try:
+                set_vol, normal_vol = (float(part) for part in value.split(','))
+            except ValueError:
+                continue
+            players.append((name, set_vol, normal_vol))
+        return players
+
+    def set_players(self, players):
+        with self.lock:
+            self.config[PLAYERS_SECTION] = {
+                name: f"{set_vol:g}, {normal_vol:g}" for name, set_vol, normal_vol in players
+            }
+
+    def save(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            atomic_write(self.path, self.config.write, '.config-')
+            self.watch.stamp = file_stamp(self.path)
+
+    def poll(self):
+        if not self.watch.changed():
+            return {}
+
+        with self.lock:
+            old = dict(self.config[SECTION])
+            old_players = self.players()
+            self.config = self._read()
+            new = dict(self.config[SECTION])
+            new_players = self.players()
+
+        changes = {key: value for key, value in new.items() if old.get(key) != value}
+        if new_players != old_players:
+            changes['players'] = ', '.join(name for name, _, _ in new_players)
+        return changes
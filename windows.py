@@ -0,0 +1,337 @@
+import os
+import sys
+import threading
+
+from loguru import logger
+
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    win32gui = win32process = None
+
+
+class ThreadedSource:
+    thread_prefix = 'source'
+    label = "Источник"
+
+    def __init__(self):
+        super().__init__()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name=f"{self.thread_prefix}-{self.name}", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        if self._error is not None or not self._ready.is_set():
+            self.close()
+            raise RuntimeError(self._error or "нет ответа")
+        return self
+
+    def _serve(self):
+        try:
+            self._run()
+        except Exception as e:
+            started = self._ready.is_set()
+            self._error = e
+            self._ready.set()
+            if started and not self._stop.is_set():
+                logger.error(f"{self.label} {self.name} остановлен: {e}")
+
+    def close(self):
+        self._stop.set()
+
+
+class Win32WindowSource:
+    name = 'win32'
+
+    def windows(self):
+        hwnds = []
+
+        def callback(hwnd, _):
+            if win32gui.IsWindowVisible(hwnd):
+                hwnds.append(hwnd)
+            return True
+
+        win32gui.EnumWindows(callback, None)
+        return hwnds
+
+    def pid(self, hwnd):
+        return win32process.GetWindowThreadProcessId(hwnd)[1]
+
+    def title(self, hwnd):
+        return win32gui.GetWindowText(hwnd)
+
+
+class FakeWindowSource:
+    name = 'fake'
+
+    def __init__(self, windows=()):
+        self.entries = {hwnd: (pid, title) for hwnd, pid, title in windows}
+        self.title_reads = 0
+
+    def windows(self):
+        return list(self.entries)
+
+    def pid(self, hwnd):
+        return self.entries[hwnd][0]
+
+    def title(self, hwnd):
+        self.title_reads += 1
+        return self.entries[hwnd][1]
+
+
+class EventWindowSource(ThreadedSource):
+    thread_prefix = 'windows'
+    label = "Источник окон"
+
+    def __init__(self):
+        super().__init__()
+        self.entries = {}
+        self.version = 0
+        self.on_change = None
+        self.title_reads = 0
+        self._lock = threading.Lock()
+
+    def update(self, hwnd, pid, title):
+        with self._lock:
+            if self.entries.get(hwnd) == (pid, title):
+                return
+            self.entries[hwnd] = (pid, title)
+            self.version += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    def remove(self, hwnd):
+        with self._lock:
+            if self.entries.pop(hwnd, None) is None:
+                return
+            self.version += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    def windows(self):
+        with self._lock:
+            return list(self.entries)
+
+    def pid(self, hwnd):
+        return self.entries.get(hwnd, (None, None))[0]
+
+    def title(self, hwnd):
+        self.title_reads += 1
+        return self.entries.get(hwnd, (None, None))[1]
+
+
+class Win32EventWindowSource(EventWindowSource):
+    name = 'winevent'
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_OBJECT_DESTROY = 0x8001
+    EVENT_OBJECT_SHOW = 0x8002
+    EVENT_OBJECT_HIDE = 0x8003
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    OBJID_WINDOW = 0
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    GA_ROOT = 2
+    WM_QUIT = 0x0012
+
+    def __init__(self):
+        super().__init__()
+        self._thread_id = None
+
+    def _run(self):
+        import ctypes
+        from ctypes import wintypes
+
+        user32 = ctypes.windll.user32
+        user32.GetAncestor.argtypes = [wintypes.HWND, wintypes.UINT]
+        user32.GetAncestor.restype = wintypes.HWND
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        win_event_proc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG,
+                                            wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        enum_proc = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+        buffer = ctypes.create_unicode_buffer(512)
+        pid = wintypes.DWORD()
+
+        def refresh(hwnd):
+            if not user32.IsWindowVisible(hwnd) or user32.GetAncestor(hwnd, self.GA_ROOT) != hwnd:
+                self.remove(hwnd)
+                return
+            user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+            user32.GetWindowTextW(hwnd, buffer, len(buffer))
+            self.update(hwnd, pid.value, buffer.value)
+
+        def on_window(hwnd, _):
+            refresh(hwnd)
+            return True
+
+        def on_event(hook, event, hwnd, id_object, id_child, thread, timestamp):
+            if not hwnd or id_object != self.OBJID_WINDOW or id_child != 0:
+                return
+            if event == self.EVENT_OBJECT_DESTROY:
+                self.remove(hwnd)
+            else:
+                refresh(hwnd)
+
+        callback = win_event_proc(on_event)
+        user32.EnumWindows(enum_proc(on_window), 0)
+        hooks = [user32.SetWinEventHook(low, high, None, callback, 0, 0, self.WINEVENT_SKIPOWNPROCESS)
+                 for low, high in ((self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND),
+                                   (self.EVENT_OBJECT_DESTROY, self.EVENT_OBJECT_HIDE),
+                                   (self.EVENT_OBJECT_NAMECHANGE, self.EVENT_OBJECT_NAMECHANGE))]
+        try:
+            if not all(hooks):
+                raise OSError(f"SetWinEventHook: {ctypes.GetLastError()}")
+            self._thread_id = ctypes.windll.kernel32.GetCurrentThreadId()
+            self._ready.set()
+            msg = wintypes.MSG()
+            while not self._stop.is_set() and user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+        finally:
+            for hook in hooks:
+                if hook:
+                    user32.UnhookWinEvent(hook)
+
+    def close(self):
+        super().close()
+        if self._thread_id is not None:
+            import ctypes
+            ctypes.windll.user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+
+
+class X11WindowSource(EventWindowSource):
+    name = 'x11'
+
+    PROPERTY_CHANGE_MASK = 1 << 22
+    PROPERTY_NOTIFY = 28
+    ANY_PROPERTY_TYPE = 0
+
+    def _run(self):
+        import ctypes
+        import ctypes.util
+        import select
+        from ctypes import POINTER, byref, c_char_p, c_int, c_long, c_ulong, c_void_p
+
+        class XPropertyEvent(ctypes.Structure):
+            _fields_ = [('type', c_int), ('serial', c_ulong), ('send_event', c_int), ('display', c_void_p),
+                        ('window', c_ulong), ('atom', c_ulong), ('time', c_ulong), ('state', c_int)]
+
+        path = ctypes.util.find_library('X11')
+        if path is None:
+            raise OSError("libX11 не найден")
+        xlib = ctypes.cdll.LoadLibrary(path)
+        xlib.XOpenDisplay.argtypes = [c_char_p]
+        xlib.XOpenDisplay.restype = c_void_p
+        xlib.XDefaultRootWindow.argtypes = [c_void_p]
+        xlib.XDefaultRootWindow.restype = c_ulong
+        xlib.XInternAtom.argtypes = [c_void_p, c_char_p, c_int]
+        xlib.XInternAtom.restype = c_ulong
+        xlib.XSelectInput.argtypes = [c_void_p, c_ulong, c_long]
+        xlib.XGetWindowProperty.argtypes = [c_void_p, c_ulong, c_ulong, c_long, c_long, c_int, c_ulong,
+                                            POINTER(c_ulong), POINTER(c_int), POINTER(c_ulong),
+                                            POINTER(c_ulong), POINTER(c_void_p)]
+        xlib.XFree.argtypes = [c_void_p]
+        xlib.XPending.argtypes = [c_void_p]
+        xlib.XNextEvent.argtypes = [c_void_p, c_void_p]
+        xlib.XConnectionNumber.argtypes = [c_void_p]
+        xlib.XCloseDisplay.argtypes = [c_void_p]
+
+        # обработчик по умолчанию завершает процесс на BadWindow от уже закрытых окон
+        self._error_handler = ctypes.CFUNCTYPE(c_int, c_void_p, c_void_p)(lambda display, error: 0)
+        xlib.XSetErrorHandler(self._error_handler)
+
+        display = xlib.XOpenDisplay(None)
+        if not display:
+            raise OSError(f"нет X-дисплея {os.environ.get('DISPLAY', '')!r}")
+
+        def atom(name):
+            return xlib.XInternAtom(display, name, False)
+
+        root = xlib.XDefaultRootWindow(display)
+        net_client_list = atom(b'_NET_CLIENT_LIST')
+        net_active_window = atom(b'_NET_ACTIVE_WINDOW')
+        net_wm_name = atom(b'_NET_WM_NAME')
+        net_wm_pid = atom(b'_NET_WM_PID')
+        wm_name = atom(b'WM_NAME')
+
+        def prop(window, name):
+            actual, fmt, count, after, data = c_ulong(), c_int(), c_ulong(), c_ulong(), c_void_p()
+            status = xlib.XGetWindowProperty(display, window, name, 0, 4096, False, self.ANY_PROPERTY_TYPE,
+                                             byref(actual), byref(fmt), byref(count), byref(after), byref(data))
+            if status != 0 or not data.value:
+                return None
+            try:
+                if fmt.value == 32:
+                    return list((c_ulong * count.value).from_address(data.value))
+                if fmt.value == 8:
+                    return ctypes.string_at(data.value, count.value)
+                return None
+            finally:
+                xlib.XFree(data)
+
+        def refresh(window):
+            title = prop(window, net_wm_name) or prop(window, wm_name)
+            pid = prop(window, net_wm_pid)
+            self.update(window, pid[0] if pid else None,
+                        title.decode('utf-8', 'replace') if isinstance(title, bytes) else None)
+
+        def sync_clients():
+            clients = set(prop(root, net_client_list) or ())
+            for window in self.windows():
+                if window not in clients:
+                    self.remove(window)
+            for window in clients:
+                if window not in self.entries:
+                    xlib.XSelectInput(display, window, self.PROPERTY_CHANGE_MASK)
+                    refresh(window)
+
+        event = (c_long * 24)()
+        notify = ctypes.cast(event, POINTER(XPropertyEvent)).contents
+        try:
+            xlib.XSelectInput(display, root, self.PROPERTY_CHANGE_MASK)
+            sync_clients()
+            self._ready.set()
+            connection = xlib.XConnectionNumber(display)
+            while not self._stop.is_set():
+                if not xlib.XPending(display):
+                    select.select([connection], [], [], 0.5)
+                    continue
+                xlib.XNextEvent(display, event)
+                if notify.type != self.PROPERTY_NOTIFY:
+                    continue
+                if notify.window == root:
+                    if notify.atom == net_client_list:
+                        sync_clients()
+                    elif notify.atom == net_active_window:
+                        active = prop(root, net_active_window)
+                        if active and active[0] in self.entries:
+                            refresh(active[0])
+                elif notify.atom in (net_wm_name, wm_name):
+                    refresh(notify.window)
+        finally:
+            xlib.XCloseDisplay(display)
+
+
+WINDOW_SOURCES = (Win32EventWindowSource, X11WindowSource)
+
+
+def create_window_source(kind='auto'):
+    if kind == 'auto':
+        candidates = [Win32EventWindowSource] if sys.platform == 'win32' else [X11WindowSource]
+    else:
+        candidates = [source for source in WINDOW_SOURCES if source.name == kind]
+
+    for source in candidates:
+        try:
+            return source().start()
+        except Exception as e:
+            logger.warning(f"Источник окон {source.name} недоступен: {e}")
+
+    if win32gui is None:
+        logger.warning("win32gui недоступен, окна браузеров не проверяются")
+        return FakeWindowSource()
+    return Win32WindowSource()